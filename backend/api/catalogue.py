@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+
+from core.cache import get_version
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from recipes.models import Ingredients
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import IngredientsSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CatalogueState:
+    '''Rendered catalogue of one version with its compressed variants.'''
+
+    def __init__(self, version, body):
+        self.version = version
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, 9)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body)
+        self.digest = hashlib.sha1(body).hexdigest()
+
+    def etag(self, encoding):
+        return f'"{self.digest}-{encoding}"'
+
+
+class IngredientCatalogue:
+    '''Full ingredients list response.
+    Serialized, rendered and compressed once per catalogue version.'''
+
+    preference = ('br', 'gzip')
+
+    def __init__(self):
+        self.state = None
+
+    def get(self):
+        version = get_version('ingredients')
+        if self.state is None or self.state.version != version:
+            data = IngredientsSerializer(
+                Ingredients.objects.all(), many=True
+            ).data
+            self.state = CatalogueState(version, JSONRenderer().render(data))
+        return self.state
+
+    def choose_encoding(self, request, state):
+        accepted = set()
+        for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+            coding, _, params = item.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00'):
+                accepted.add(coding.strip().lower())
+        for encoding in self.preference:
+            if encoding in accepted and encoding in state.variants:
+                return encoding
+        return 'identity'
+
+    def response(self, request):
+        state = self.get()
+        encoding = self.choose_encoding(request, state)
+        etag = state.etag(encoding)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(
+                state.variants[encoding], content_type='application/json'
+            )
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+ingredient_catalogue = IngredientCatalogue()
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def ingredient_changed(sender, **kwargs):
+    '''Rebuild the catalogue once the change is committed.'''
+    transaction.on_commit(ingredient_catalogue.get)
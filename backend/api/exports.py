@@ -0,0 +1,90 @@
+import csv
+import json
+
+from django.db.models import CharField, Max
+from django.db.models.functions import Cast, Length
+
+EXPORT_CHUNK = 500
+TITLE = 'The list of goods for your recipes. \n\n'
+
+
+def shopping_rows(user):
+    '''(name, measurement unit, total) of the user's shopping list,
+    read through a server-side cursor where the database has one.'''
+    return user.shoplist_totals.values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'total'
+    ).order_by('ingredient__name').iterator(chunk_size=EXPORT_CHUNK)
+
+
+def chunked(lines):
+    '''Join lines into chunks of EXPORT_CHUNK for the response.'''
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == EXPORT_CHUNK:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def text_lines(user):
+    '''ASCII table. Column widths come from one aggregate query.'''
+    widths = user.shoplist_totals.aggregate(
+        name=Max(Length('ingredient__name')),
+        total=Max(Length(Cast('total', CharField()))),
+        unit=Max(Length('ingredient__measurement_unit')),
+    )
+    if widths['name'] is None:
+        yield TITLE + 'The shopping list is empty.\n'
+        return
+    name, total, unit = widths['name'], widths['total'], widths['unit']
+    divider = '\n|{}|{}|{}|\n'.format(
+        '_' * (name + 2), '_' * (total + 2), '_' * (unit + 2)
+    )
+    yield TITLE + f',{"_" * (len(divider) - 4)},\n'
+    separator = ''
+    for row in shopping_rows(user):
+        yield (
+            f'{separator}| {row[0]:<{name}} | {row[2]:<{total}} '
+            f'| {row[1]:<{unit}} |'
+        )
+        separator = divider
+    yield divider
+
+
+class Echo:
+    '''File-like object returning what is written to it.'''
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'total'))
+    for row in shopping_rows(user):
+        yield writer.writerow(row)
+
+
+def json_lines(user):
+    separator = '['
+    for name, unit, total in shopping_rows(user):
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'total': total},
+            ensure_ascii=False,
+        )
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_EXPORTS = {
+    'txt': text_lines,
+    'csv': csv_lines,
+    'json': json_lines,
+}
+
+
+def export_shopping_list(user, export_format):
+    '''Chunks of the user's shopping list in txt, csv or json.'''
+    return chunked(SHOPPING_EXPORTS[export_format](user))
@@ -1,18 +1,74 @@
+from core.cache import get_versions
 from django.core.exceptions import ValidationError
 from django_filters.fields import MultipleChoiceField
 from django_filters.rest_framework import FilterSet, filters
 from django_filters.widgets import BooleanWidget
-from recipes.models import Recipe
+from recipes.membership import get_member_ids
+from recipes.models import Favourites, Recipe, ShopList
 from rest_framework.filters import SearchFilter
 
 
+class DistinctValues:
+    '''Distinct values of a model field.
+    Kept per process and rebuilt when the given versions change.'''
+
+    registry = {}
+
+    def __init__(self, model, field_name, versions):
+        self.model = model
+        self.field_name = field_name
+        self.versions = versions
+        self.state = (None, [], frozenset())
+
+    @classmethod
+    def get(cls, model, field_name, versions):
+        key = (model, field_name, versions)
+        if key not in cls.registry:
+            cls.registry[key] = cls(model, field_name, versions)
+        return cls.registry[key].refresh()
+
+    def refresh(self):
+        version = get_versions(*self.versions)
+        if version != self.state[0]:
+            values = list(
+                self.model._default_manager.distinct()
+                .order_by(self.field_name)
+                .values_list(self.field_name, flat=True)
+            )
+            self.state = (
+                version,
+                [(value, value) for value in values],
+                frozenset(str(value) for value in values),
+            )
+        return self
+
+    @property
+    def choices(self):
+        return self.state[1]
+
+    @property
+    def values(self):
+        return self.state[2]
+
+
 class IngredientsFilter(SearchFilter):
     '''Ingredients objects filter.'''
 
     search_param = 'name'
 
 
-class TagsMultiChoiceField(MultipleChoiceField):
+class SetMultipleChoiceField(MultipleChoiceField):
+    '''Multiple choice field validated against a set of values.'''
+
+    def __init__(self, *args, choice_values=frozenset(), **kwargs):
+        self.choice_values = choice_values
+        super().__init__(*args, **kwargs)
+
+    def valid_value(self, value):
+        return str(value) in self.choice_values
+
+
+class TagsMultiChoiceField(SetMultipleChoiceField):
     '''Validation as field_class for Tags Filter'''
 
     def validate(self, value):
@@ -21,7 +77,7 @@ class TagsMultiChoiceField(MultipleChoiceField):
                 self.error_messages['required'], code='required'
             )
         for v in value:
-            if v in self.choices and not self.valid_value(v):
+            if v in self.choice_values and not self.valid_value(v):
                 raise ValidationError(
                     self.error_messages['invalid_choice'],
                     code='invalid_choice',
@@ -29,7 +85,26 @@ class TagsMultiChoiceField(MultipleChoiceField):
                 )
 
 
-class TagsFilter(filters.AllValuesMultipleFilter):
+class CachedValuesMultipleFilter(filters.MultipleChoiceFilter):
+    '''AllValuesMultipleFilter with cached choices.'''
+
+    field_class = SetMultipleChoiceField
+
+    def __init__(self, *args, versions=('recipes',), **kwargs):
+        self.versions = versions
+        super().__init__(*args, **kwargs)
+
+    @property
+    def field(self):
+        distinct = DistinctValues.get(
+            self.model, self.field_name, self.versions
+        )
+        self.extra['choices'] = lambda: distinct.choices
+        self.extra['choice_values'] = distinct.values
+        return super().field
+
+
+class TagsFilter(CachedValuesMultipleFilter):
     '''Tags objects filter.'''
 
     field_class = TagsMultiChoiceField
@@ -38,17 +113,32 @@ class TagsFilter(filters.AllValuesMultipleFilter):
 class RecipesFilter(FilterSet):
     '''Recipes objects filter.'''
 
-    tags = TagsFilter(field_name='tags__slug', label='Slug')
-    author = filters.AllValuesMultipleFilter(
+    tags = TagsFilter(
+        field_name='tags__slug', label='Slug', versions=('recipes', 'tags')
+    )
+    author = CachedValuesMultipleFilter(
         field_name='author__id', label='Author'
     )
     is_in_shopping_cart = filters.BooleanFilter(
-        widget=BooleanWidget(), label='In shop cart'
+        widget=BooleanWidget(), label='In shop cart',
+        method='filter_user_list'
     )
     is_favorited = filters.BooleanFilter(
-        widget=BooleanWidget(), label='In favorit'
+        widget=BooleanWidget(), label='In favorit',
+        method='filter_user_list'
     )
+    user_lists = {
+        'is_in_shopping_cart': ShopList,
+        'is_favorited': Favourites,
+    }
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author', 'is_in_shopping_cart', 'is_favorited')
+
+    def filter_user_list(self, queryset, name, value):
+        '''Filter by cached ids of the user's favourites or shop cart.'''
+        ids = get_member_ids(self.user_lists[name], self.request.user)
+        if value:
+            return queryset.filter(id__in=ids)
+        return queryset.exclude(id__in=ids)
@@ -0,0 +1,50 @@
+import hashlib
+
+from core.cache import get_versions
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+
+class ConditionalGetMixin:
+    '''ETag support for list and retrieve actions.
+
+    etag_versions are the change counters of the listed data,
+    etag_user_versions are per-user counters added for authenticated users.
+    Requests matching If-None-Match are answered with 304 Not Modified
+    before any query or serialization.'''
+
+    etag_versions = ()
+    etag_user_versions = ()
+
+    def get_etag(self, request):
+        user_id = request.user.pk
+        versions = self.etag_versions
+        if user_id is not None:
+            versions += tuple(
+                f'{name}:{user_id}' for name in self.etag_user_versions
+            )
+        signature = repr((
+            type(self).__name__,
+            request.get_full_path(),
+            request.accepted_renderer.format,
+            user_id,
+            sorted(get_versions(*versions).items()),
+        ))
+        return quote_etag(hashlib.md5(signature.encode()).hexdigest())
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
@@ -22,3 +22,13 @@ class IsAdminAuthorOrReadOnly(permissions.IsAuthenticatedOrReadOnly):
             or request.user.is_admin
             or request.user.is_superuser
         )
+
+
+class IsAdmin(permissions.IsAuthenticated):
+    '''Admins only'''
+
+    def has_permission(self, request, view):
+        return (
+            super().has_permission(request, view)
+            and request.user.is_admin
+        )
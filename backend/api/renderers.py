@@ -0,0 +1,22 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class PlainTextRenderer(BaseRenderer):
+    '''Negotiates ?format=txt. Exports are streamed by the views,
+    so this only renders error responses.'''
+
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    '''Negotiates ?format=csv.'''
+
+    media_type = 'text/csv'
+    format = 'csv'
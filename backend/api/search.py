@@ -0,0 +1,190 @@
+import math
+import re
+import time
+from bisect import bisect_left
+
+from core.cache import get_version, get_versions
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import IngredientInRecipe, Ingredients
+
+WORD_RE = re.compile(r'\w+')
+PREFIX_BONUS = 0.5
+# Most used ingredient's similarity is raised by this share.
+POPULARITY_WEIGHT = 0.3
+MIN_SIMILARITY = 0.1
+USAGE_REFRESH = getattr(settings, 'INGREDIENT_USAGE_REFRESH', 60)
+
+
+def trigrams(text):
+    '''Trigrams of every word padded the way pg_trgm does.'''
+    grams = set()
+    for word in WORD_RE.findall(text.casefold()):
+        word = f'  {word} '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return frozenset(grams)
+
+
+class IndexState:
+    '''Snapshot of the index. Replaced as a whole on every change.'''
+
+    def __init__(self, version, keys, rows, grams, postings):
+        self.version = version
+        self.keys = keys
+        self.rows = rows
+        self.grams = grams
+        self.postings = postings
+        self.by_id = {row['id']: row for row in rows}
+
+    @classmethod
+    def build(cls, version, rows):
+        rows = sorted(
+            rows, key=lambda row: (row['name'].casefold(), row['id'])
+        )
+        grams = {row['id']: trigrams(row['name']) for row in rows}
+        postings = {}
+        for ingredient_id, ingredient_grams in grams.items():
+            for gram in ingredient_grams:
+                postings.setdefault(gram, set()).add(ingredient_id)
+        return cls(
+            version,
+            [(row['name'].casefold(), row['id']) for row in rows],
+            rows,
+            grams,
+            postings,
+        )
+
+    def changed(self, version, ingredient_id, row=None):
+        '''New state with one ingredient removed and, if given, re-added.'''
+        keys, rows = list(self.keys), list(self.rows)
+        grams, postings = dict(self.grams), dict(self.postings)
+        for position, key in enumerate(keys):
+            if key[1] == ingredient_id:
+                del keys[position], rows[position]
+                break
+        for gram in grams.pop(ingredient_id, ()):
+            postings[gram] = postings[gram] - {ingredient_id}
+        if row is not None:
+            key = (row['name'].casefold(), row['id'])
+            position = bisect_left(keys, key)
+            keys.insert(position, key)
+            rows.insert(position, row)
+            grams[row['id']] = trigrams(row['name'])
+            for gram in grams[row['id']]:
+                postings[gram] = postings.get(gram, set()) | {row['id']}
+        return IndexState(version, keys, rows, grams, postings)
+
+
+class IngredientIndex:
+    '''Per-process index of ingredient names.
+
+    Prefix search runs over a sorted list of casefolded names, ranked
+    search over trigram postings scored by similarity and by usage in
+    recipes. Changes saved in this process are applied incrementally,
+    changes from other processes rebuild the index.'''
+
+    def __init__(self):
+        self.state = IndexState.build(None, [])
+        self.usage = (None, 0, {}, 1)
+
+    def refresh(self):
+        version = get_version('ingredients')
+        if version != self.state.version:
+            self.state = IndexState.build(
+                version,
+                Ingredients.objects.values('id', 'name', 'measurement_unit'),
+            )
+        return self.state
+
+    def apply(self, version, ingredient_id, row=None):
+        '''Apply a change if it is the only one since the index was built.'''
+        state = self.state
+        if state.version is not None and state.version == version - 1:
+            self.state = state.changed(version, ingredient_id, row)
+
+    def get_usage(self):
+        '''Recipes count by ingredient id, recounted at most every
+        USAGE_REFRESH seconds after recipes change.'''
+        version, checked, counts, top = self.usage
+        now = time.monotonic()
+        if now - checked >= USAGE_REFRESH:
+            current = get_versions('recipes')['recipes']
+            if current != version:
+                counts = dict(
+                    IngredientInRecipe.objects.values('ingredient_id')
+                    .annotate(total=Count('recipe_id'))
+                    .values_list('ingredient_id', 'total')
+                    .order_by()
+                )
+                top = max(counts.values(), default=1)
+            self.usage = (current, now, counts, top)
+        return counts, top
+
+    def search(self, prefix, limit=None):
+        '''Ingredients whose name starts with prefix, case insensitive.'''
+        state = self.refresh()
+        prefix = prefix.casefold()
+        results = []
+        for position in range(bisect_left(state.keys, (prefix,)),
+                              len(state.keys)):
+            if not state.keys[position][0].startswith(prefix):
+                break
+            results.append(state.rows[position])
+            if len(results) == limit:
+                break
+        return results
+
+    def ranked_search(self, query, limit=None):
+        '''Typo tolerant search ranked by trigram similarity,
+        name prefix match and popularity. Popularity scales the
+        similarity, so it never lifts a poor match over a close one.'''
+        state = self.refresh()
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        counts, top = self.get_usage()
+        log_top = math.log1p(top)
+        query = query.casefold()
+        matches = {}
+        for gram in query_grams:
+            for ingredient_id in state.postings.get(gram, ()):
+                matches[ingredient_id] = matches.get(ingredient_id, 0) + 1
+        scored = []
+        for ingredient_id, common in matches.items():
+            name = state.by_id[ingredient_id]['name'].casefold()
+            similarity = common / len(
+                query_grams | state.grams[ingredient_id]
+            )
+            prefix = name.startswith(query)
+            if similarity < MIN_SIMILARITY and not prefix:
+                continue
+            popularity = math.log1p(counts.get(ingredient_id, 0)) / log_top
+            score = (
+                similarity * (1 + POPULARITY_WEIGHT * popularity)
+                + PREFIX_BONUS * prefix
+            )
+            scored.append((-score, name, ingredient_id))
+        scored.sort()
+        return [state.by_id[item[2]] for item in scored[:limit]]
+
+
+ingredient_index = IngredientIndex()
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def ingredient_changed(sender, instance, **kwargs):
+    '''Apply the change to this process' index after commit.
+    Runs after the recipes app receiver has bumped the counter.'''
+    ingredient_id, row = instance.id, None
+    if 'created' in kwargs:
+        row = {
+            'id': instance.id,
+            'name': instance.name,
+            'measurement_unit': instance.measurement_unit,
+        }
+    transaction.on_commit(lambda: ingredient_index.apply(
+        get_version('ingredients'), ingredient_id, row
+    ))
@@ -1,44 +1,107 @@
-from django.core.files.base import ContentFile
+from core.cache import bump_on_commit, get_versions
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 from users.models import UserCustomized, Follow
 from djoser.serializers import UserCreateSerializer  # UserSerializer
-from django.db.models import F
+from recipes.images import decode_base64_image, derivative_names
 from recipes.models import (
     Ingredients,
     IngredientInRecipe,
     Recipe,
     Tag,
-    ShopList,
-    Favourites
 )
-import base64
+from recipes.shopping import shift_recipe_totals
+
+CARD_KEY = 'recipe-card:{}:{}:{}:{}:{}'
+CARD_TIMEOUT = getattr(settings, 'CARD_CACHE_TIMEOUT', 24 * 3600)
+
+
+def get_followed_ids(request):
+    '''Ids of the authors the requesting user follows.
+    Read once and kept on the request for all serializers of a response.'''
+    followed = getattr(request, '_followed_author_ids', None)
+    if followed is None:
+        followed = frozenset()
+        if request.user.is_authenticated:
+            followed = frozenset(
+                request.user.follower.values_list('author_id', flat=True)
+            )
+        request._followed_author_ids = followed
+    return followed
+
+
+def is_subscribed(context, author_id):
+    '''Check if the requesting user follows the author.'''
+    request = context.get('request')
+    if request is None:
+        return False
+    return author_id in get_followed_ids(request)
 
 
 class GetIngredientsMixin:
     '''Recipe's Mixin.'''
 
     def get_ingredients(self, obj):
-        '''Ingredients retrievement for recipes'''
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientinrecipe__amount'),
-        )
+        '''Ingredients retrievement for recipes.
+        Uses prefetched ingredientinrecipe_set when available.'''
+        items = obj.ingredientinrecipe_set.all()
+        if 'ingredientinrecipe_set' not in getattr(
+            obj, '_prefetched_objects_cache', {}
+        ):
+            items = items.select_related('ingredient')
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in items
+        ]
 
 
 class Base64ImageField(serializers.ImageField):
     '''Pictures decoding'''
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                data = decode_base64_image(data)
+            except ValueError:
+                self.fail('invalid_image')
 
         return super().to_internal_value(data)
 
 
+class ImageDerivativesField(serializers.ReadOnlyField):
+    '''URLs of the resized copies of an image by size and format.
+    The original stands in for every copy until they are made.'''
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get('request')
+        names = derivative_names(value.name)
+        if not value.instance.derivatives_ready:
+            names = {
+                size: dict.fromkeys(formats, value.name)
+                for size, formats in names.items()
+            }
+        return {
+            size: {
+                image_format: (
+                    request.build_absolute_uri(value.storage.url(name))
+                    if request else value.storage.url(name)
+                )
+                for image_format, name in formats.items()
+            }
+            for size, formats in names.items()
+        }
+
+
 class PostUserSerializer(UserCreateSerializer):
     '''User creation and change'''
     first_name = serializers.CharField(max_length=150, required=True)
@@ -89,10 +152,7 @@ class GetUserSerializer(serializers.ModelSerializer):
     read_only_fields = ('is_subscribed',)
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user.follower.filter(author=obj.id).exists()
+        return is_subscribed(self.context, obj.id)
 
 
 class TagsSerializer(serializers.ModelSerializer):
@@ -111,21 +171,128 @@ class IngredientsSerializer(serializers.ModelSerializer):
         fields = 'id', 'name', 'measurement_unit'
 
 
+class CardUserSerializer(serializers.ModelSerializer):
+    '''Recipe author, the part shared by all users.'''
+
+    class Meta:
+        model = UserCustomized
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class RecipeCardSerializer(GetIngredientsMixin, serializers.ModelSerializer):
+    '''Recipe card, the part of a recipe shared by all users.'''
+
+    tags = TagsSerializer(many=True)
+    author = CardUserSerializer()
+    ingredients = serializers.SerializerMethodField()
+    images = ImageDerivativesField(source='image')
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'id', 'name', 'text', 'cooking_time', 'image', 'images',
+            'ingredients', 'tags', 'author'
+        )
+
+
+def get_recipe_cards(recipes):
+    '''Pre-serialized recipe cards by recipe id.
+    Cards are cached by recipe, tags, ingredients and author versions;
+    only the missing ones are prefetched and serialized.'''
+    versions = get_versions('tags', 'ingredients', *(
+        name for recipe in recipes
+        for name in (f'recipe:{recipe.id}', f'user:{recipe.author_id}')
+    ))
+    keys = {
+        recipe.id: CARD_KEY.format(
+            recipe.id,
+            versions[f'recipe:{recipe.id}'],
+            versions['tags'],
+            versions['ingredients'],
+            versions[f'user:{recipe.author_id}'],
+        )
+        for recipe in recipes
+    }
+    cached = cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.id] not in cached]
+    if missing:
+        prefetch_related_objects(
+            missing,
+            'tags',
+            Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+        built = {
+            keys[recipe.id]: RecipeCardSerializer(recipe).data
+            for recipe in missing
+        }
+        cache.set_many(built, CARD_TIMEOUT)
+        cached.update(built)
+    return {recipe_id: cached[key] for recipe_id, key in keys.items()}
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    '''Recipes page serialization from cached cards.'''
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        cards = get_recipe_cards(recipes)
+        return [self.child.overlay(cards[recipe.id]) for recipe in recipes]
+
+
 class GetRecipeSerializer(GetIngredientsMixin, serializers.ModelSerializer):
     '''Recipes' objects serialization. Recipes list'''
 
     tags = TagsSerializer(many=True)
     author = GetUserSerializer()
     ingredients = serializers.SerializerMethodField()
-    is_favorited = serializers.BooleanField(default=False)
-    is_in_shopping_cart = serializers.BooleanField(default=False)
+    images = ImageDerivativesField(source='image')
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'name', 'text', 'cooking_time', 'image', 'ingredients',
-            'tags', 'author', 'is_favorited', 'is_in_shopping_cart'
+            'id', 'name', 'text', 'cooking_time', 'image', 'images',
+            'ingredients', 'tags', 'author', 'is_favorited',
+            'is_in_shopping_cart'
+        )
+        list_serializer_class = RecipeListSerializer
+
+    def overlay(self, card):
+        '''Recipe card completed with the requesting user's flags.'''
+        data = dict(card)
+        request = self.context['request']
+        if data['image']:
+            data['image'] = request.build_absolute_uri(data['image'])
+            data['images'] = {
+                size: {
+                    image_format: request.build_absolute_uri(url)
+                    for image_format, url in formats.items()
+                }
+                for size, formats in data['images'].items()
+            }
+        if data['author'] is not None:
+            data['author'] = dict(
+                data['author'],
+                is_subscribed=is_subscribed(
+                    self.context, data['author']['id']
+                ),
+            )
+        data['is_favorited'] = data['id'] in self.context.get(
+            'favorited', ()
         )
+        data['is_in_shopping_cart'] = data['id'] in self.context.get(
+            'in_shopping_cart', ()
+        )
+        return data
+
+    def to_representation(self, instance):
+        return self.overlay(get_recipe_cards([instance])[instance.id])
 
 
 class CreateUpdateRecipeSerializer(GetIngredientsMixin,
@@ -146,31 +313,61 @@ class CreateUpdateRecipeSerializer(GetIngredientsMixin,
         read_only_fields = ('author',)
 
     def validate(self, data):
-        '''Ingredients' validation for recipe.'''
-        ingredients = self.initial_data['ingredients']
-        ingredient_list = []
+        '''Ingredients' validation for recipe.
+        All ingredients are checked with one query and all problems
+        are reported together.'''
+        ingredients = self.initial_data.get('ingredients')
         if not ingredients:
             raise serializers.ValidationError(
                 'Add at least 1 ingredint.'
             )
+        if not isinstance(ingredients, list):
+            raise serializers.ValidationError(
+                {'ingredients': ['A list of ingredients is expected.']}
+            )
+        amounts, errors = self.read_amounts(ingredients)
+        missing = set(amounts) - set(
+            Ingredients.objects.filter(id__in=amounts).values_list(
+                'id', flat=True
+            )
+        )
+        if missing:
+            errors.append(f'No such ingredients: {sorted(missing)}.')
+        if errors:
+            raise serializers.ValidationError({'ingredients': errors})
+        data['ingredients'] = [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in amounts.items()
+        ]
+        return data
+
+    def read_amounts(self, ingredients):
+        '''{ingredient id: amount} and errors of the submitted items.'''
+        amounts, duplicates, errors = {}, set(), []
         for item in ingredients:
-            ingredient = get_object_or_404(Ingredients, id=item['id'])
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError(
-                    'Ingredient must be unique.'
+            try:
+                ingredient_id, amount = int(item['id']), int(item['amount'])
+            except (KeyError, TypeError, ValueError):
+                errors.append(f'Invalid ingredient: {item}.')
+                continue
+            if ingredient_id in amounts:
+                duplicates.add(ingredient_id)
+            if amount < 1:
+                errors.append(
+                    f'Minimum quantity is 1 unit (ingredient {ingredient_id}).'
                 )
-            if int(item['amount']) < 1:
-                raise serializers.ValidationError('Minimum quantity is 1 unit')
-            ingredient_list.append(ingredient)
-        data['ingredients'] = ingredients
-        return data
+            amounts[ingredient_id] = amount
+        if duplicates:
+            errors.append(
+                f'Ingredient must be unique: {sorted(duplicates)}.'
+            )
+        return amounts, errors
 
     def ingreds_and_tags_add(self, instance, **validate_data):
         '''Ingredient tags adding.'''
         ingredients = validate_data['ingredients']
         tags = validate_data['tags']
-        for tag in tags:
-            instance.tags.add(tag)
+        instance.tags.add(*tags)
 
         IngredientInRecipe.objects.bulk_create(
             [
@@ -182,8 +379,56 @@ class CreateUpdateRecipeSerializer(GetIngredientsMixin,
                 for ingredient in ingredients
             ]
         )
+        bump_on_commit('recipes', f'recipe:{instance.id}')
+        return instance
+
+    def ingreds_and_tags_update(self, instance, **validate_data):
+        '''Ingredients and tags update.
+        Only the rows that differ are inserted, updated or deleted.'''
+        instance.tags.set(validate_data['tags'])
+        wanted = {
+            int(ingredient['id']): int(ingredient['amount'])
+            for ingredient in validate_data['ingredients']
+        }
+        current = {
+            item.ingredient_id: item
+            for item in instance.ingredientinrecipe_set.order_by()
+        }
+        shift_recipe_totals(instance.id, {
+            ingredient_id: wanted.get(ingredient_id, 0) - (
+                current[ingredient_id].amount if ingredient_id in current
+                else 0
+            )
+            for ingredient_id in wanted.keys() | current.keys()
+        })
+        stale = [
+            item.id for ingredient_id, item in current.items()
+            if ingredient_id not in wanted
+        ]
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = wanted.get(ingredient_id, item.amount)
+            if item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        new = [
+            IngredientInRecipe(
+                recipe=instance, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in wanted.items()
+            if ingredient_id not in current
+        ]
+        if stale:
+            IngredientInRecipe.objects.filter(id__in=stale).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        if new:
+            IngredientInRecipe.objects.bulk_create(new)
+        if changed or new:
+            bump_on_commit('recipes', f'recipe:{instance.id}')
         return instance
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -192,12 +437,11 @@ class CreateUpdateRecipeSerializer(GetIngredientsMixin,
             recipe, ingredients=ingredients, tags=tags
         )
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        instance.tags.clear()
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance = self.ingreds_and_tags_add(
+        instance = self.ingreds_and_tags_update(
             instance, ingredients=ingredients, tags=tags
         )
         return super().update(instance, validated_data)
@@ -206,12 +450,68 @@ class CreateUpdateRecipeSerializer(GetIngredientsMixin,
 class AddRecipeSerializer(serializers.ModelSerializer):
     '''Recipes objects serialization, add to favs&shopcart'''
 
+    images = ImageDerivativesField(source='image')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image')
+        fields = ('id', 'name', 'cooking_time', 'image', 'images')
         read_only_fields = ('id', 'name', 'cooking_time', 'image')
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    '''Recipe ids of a batch favourites or shoplist change.'''
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=getattr(settings, 'LIST_BATCH_LIMIT', 100),
+    )
+
+
+def recipes_by_author(author_ids, limit=None):
+    '''{author id: recipes} with at most limit recipes per author.
+    One query, windowed with ROW_NUMBER() when limited.'''
+    queryset = Recipe.objects.filter(author_id__in=author_ids).only(
+        'id', 'name', 'cooking_time', 'image', 'derivatives_ready',
+        'author_id'
+    )
+    if limit is not None:
+        sql, params = queryset.annotate(row_number=Window(
+            RowNumber(), partition_by=F('author_id'), order_by=F('id').asc()
+        )).order_by().query.sql_with_params()
+        queryset = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            'ORDER BY id',
+            params + (limit,)
+        )
+    recipes = {author_id: [] for author_id in author_ids}
+    for recipe in queryset:
+        recipes[recipe.author_id].append(recipe)
+    return recipes
+
+
+def get_recipes_limit(request):
+    '''Positive recipes_limit query parameter or None.'''
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+class FollowListSerializer(serializers.ListSerializer):
+    '''Subscriptions page. Recipes of all authors on the page
+    are read with one query.'''
+
+    def to_representation(self, data):
+        follows = list(data.all() if hasattr(data, 'all') else data)
+        self.context['author_recipes'] = recipes_by_author(
+            {follow.author_id for follow in follows},
+            get_recipes_limit(self.context['request']),
+        )
+        return [self.child.to_representation(follow) for follow in follows]
+
+
 class FollowSerializer(serializers.ModelSerializer):
     '''Follow objects serialization'''
 
@@ -236,24 +536,25 @@ class FollowSerializer(serializers.ModelSerializer):
             'recipes',
             'recipes_count',
         )
+        list_serializer_class = FollowListSerializer
 
     def get_recipes(self, obj):
         '''Get author's recipes.'''
-        request = self.context['request']
-        limit = request.GET.get('recipes_limit')
-        queryset = obj.author.recipes.all()
-        if limit:
-            queryset = queryset[: int(limit)]
-        return AddRecipeSerializer(queryset, many=True).data
+        author_recipes = self.context.get('author_recipes')
+        if author_recipes is None:
+            author_recipes = recipes_by_author(
+                (obj.author_id,), get_recipes_limit(self.context['request'])
+            )
+        return AddRecipeSerializer(
+            author_recipes[obj.author_id], many=True
+        ).data
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.all().count()
+        return obj.author.recipes_count
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user.follower.filter(author=obj.id).exists()
+        '''Follow rows are the requesting user's subscriptions.'''
+        return obj.user_id == self.context['request'].user.id
 
 
 class CheckFollowSerializer(serializers.ModelSerializer):
@@ -288,59 +589,3 @@ class CheckFollowSerializer(serializers.ModelSerializer):
                     {'errors': 'You have already unfollowed this author'}
                 )
         return obj
-
-
-class CheckFavouriteSerializer(serializers.ModelSerializer):
-    '''Serialization of favourites and check addind to favourites.'''
-
-    user = serializers.PrimaryKeyRelatedField(
-        queryset=UserCustomized.objects.all()
-    )
-    recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
-
-    class Meta:
-        model = Favourites
-        fields = ('user', 'recipe')
-
-    def validate(self, obj):
-        '''Add to favourites validation.'''
-        user = self.context['request'].user
-        recipe = obj['recipe']
-        favorite = user.fav_adder.filter(recipe=recipe).exists()
-
-        if self.context['request'].method == 'POST' and favorite:
-            raise serializers.ValidationError(
-                'This recipe is already in favourites.'
-            )
-        if self.context['request'].method == 'DELETE' and not favorite:
-            raise serializers.ValidationError(
-                'No such a recipe in your favourites.'
-            )
-        return obj
-
-
-class CheckShopCartSerializer(serializers.ModelSerializer):
-    '''Shoplist objects serialization'''
-
-    recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
-    user = serializers.PrimaryKeyRelatedField(
-        queryset=UserCustomized.objects.all()
-    )
-
-    class Meta:
-        model = ShopList
-        fields = ('user', 'recipe')
-
-    def validate(self, obj):
-        '''Adding a recipe into shopcart validation'''
-        user = self.context['request'].user
-        recipe = obj['recipe']
-        shop_list = user.shopper.filter(recipe=recipe).exists()
-
-        if self.context['request'].method == 'POST' and shop_list:
-            raise serializers.ValidationError(
-                'Recipe in shoplist alredy.'
-            )
-        if self.context['request'].method == 'DELETE' and not shop_list:
-            raise serializers.ValidationError('Recipe not in shoplist.')
-        return obj
@@ -1,23 +1,38 @@
-from django.db.models import BooleanField, Exists, OuterRef, Sum, Value
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
+from recipes.feed import feed_queryset
+from recipes.importer import RecipeImporter
+from recipes.lists import (
+    add_many, add_to_list, remove_from_list, remove_many
+)
+from recipes.membership import get_member_ids
 from recipes.models import (
     Favourites,
     Ingredients,
-    IngredientInRecipe,
     Recipe,
     ShopList,
     Tag,
 )
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from users.models import Follow, UserCustomized
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 
+from .catalogue import ingredient_catalogue
+from .exports import export_shopping_list
 from .filters import RecipesFilter, IngredientsFilter
-from .permissions import IsAdminAuthorOrReadOnly, IsAdminOrReadOnly
+from .mixins import ConditionalGetMixin
+from .permissions import IsAdmin, IsAdminAuthorOrReadOnly, IsAdminOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
+from .search import ingredient_index
 from .serializers import (
     AddRecipeSerializer,
     IngredientsSerializer,
@@ -26,26 +41,47 @@ from .serializers import (
     TagsSerializer,
     FollowSerializer,
     CheckFollowSerializer,
-    CheckFavouriteSerializer,
-    CheckShopCartSerializer
+    RecipeIdsSerializer,
 )
-from core.pagination import StandardResultsSetPagination
+from core.pagination import (
+    FeedPagination, PopularPagination, StandardResultsSetPagination
+)
+
+IMPORT_MAX_BYTES = getattr(settings, 'IMPORT_MAX_BYTES', 50 * 1024 * 1024)
+IMPORT_MAX_LINES = getattr(settings, 'IMPORT_MAX_LINES', 10000)
 
+# Errors of adding a recipe twice and removing a missing one.
+LIST_ERRORS = {
+    Favourites: (
+        'This recipe is already in favourites.',
+        'No such a recipe in your favourites.',
+    ),
+    ShopList: ('Recipe in shoplist alredy.', 'Recipe not in shoplist.'),
+}
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     '''Tags' viewset. Tags Model.'''
 
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
+    etag_versions = ('tags',)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     '''Recipes' viewset. Recipes Model.'''
 
     permission_classes = (IsAdminAuthorOrReadOnly,)
     filter_class = RecipesFilter
+    count_versions = ('recipes', 'tags')
+    count_user_versions = {
+        'is_favorited': 'favourites',
+        'is_in_shopping_cart': 'shoplist',
+    }
+    etag_versions = ('recipes', 'tags', 'ingredients', 'users')
+    etag_user_versions = ('favourites', 'shoplist', 'follows')
 
     def get_serializer_class(self):
         '''Recipes' serialization.'''
@@ -54,19 +90,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return CreateUpdateRecipeSerializer
 
     def get_queryset(self):
+        '''Recipes with authors.
+        Tags and ingredients are fetched in bulk for uncached cards only.'''
+        return Recipe.objects.select_related('author')
+
+    def get_serializer_context(self):
         '''Check if recipe in shoplist and/or favs'''
-        user = self.request.user
-        if user.is_authenticated:
-            return Recipe.objects.annotate(
-                is_favorited=Exists(
-                    user.fav_adder.filter(recipe__pk=OuterRef('pk'))),
-                is_in_shopping_cart=Exists(
-                    user.shopper.filter(recipe__pk=OuterRef('pk')))
-            )
-        return Recipe.objects.annotate(
-            is_favorited=Value(False, output_field=BooleanField()),
-            is_in_shopping_cart=Value(False, output_field=BooleanField()),
-        )
+        context = super().get_serializer_context()
+        if self.request.method in SAFE_METHODS:
+            user = self.request.user
+            context['favorited'] = get_member_ids(Favourites, user)
+            context['in_shopping_cart'] = get_member_ids(ShopList, user)
+        return context
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -77,68 +112,142 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def shopping_cart(self, request, pk=None):
         '''Add/Delete a recipe to/from the shoplist.'''
-        data = {
-            'user': request.user.id,
-            'recipe': pk,
-        }
-        serializer = CheckShopCartSerializer(
-            data=data, context={'request': request}
-        )
+        return self.toggle_list(ShopList, request, pk)
+
+    @action(
+        detail=False, methods=('POST', 'DELETE'), url_path='shopping_cart',
+        permission_classes=(IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        '''Add/Delete many recipes to/from the shoplist.'''
+        return self.change_list(ShopList, request)
+
+    def change_list(self, model, request):
+        '''Batch change of favourites or shoplist in one transaction.
+        Every recipe id gets its own status.'''
+        serializer = RecipeIdsSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        change = add_many if request.method == 'POST' else remove_many
+        with transaction.atomic():
+            results = change(
+                model, request.user, serializer.validated_data['ids']
+            )
+        return Response({
+            'results': [
+                {'id': pk, 'status': result}
+                for pk, result in results.items()
+            ]
+        })
+
+    def toggle_list(self, model, request, pk):
+        '''Add/Delete a recipe to/from favourites or shoplist.
+        The response is built from the result of a single statement.'''
+        try:
+            pk = int(pk)
+        except ValueError:
+            return self.no_recipe(pk)
         if request.method == 'POST':
-            return self.add_object(ShopList, request.user, pk)
-        return self.delete_object(ShopList, request.user, pk)
-
-    def add_object(self, model, user, pk):
-        '''Adding objects for favourites and shoplist.'''
-        recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
-        serializer = AddRecipeSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def delete_object(self, model, user, pk):
-        '''Deleting objects from favourites and shoplist.'''
-        model.objects.filter(user=user, recipe__id=pk).delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+            recipe, added = add_to_list(model, request.user, pk)
+            if recipe is None:
+                return self.no_recipe(pk)
+            if not added:
+                return self.list_error(LIST_ERRORS[model][0])
+            serializer = AddRecipeSerializer(recipe)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if remove_from_list(model, request.user, pk):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not Recipe.objects.filter(id=pk).exists():
+            return self.no_recipe(pk)
+        return self.list_error(LIST_ERRORS[model][1])
+
+    def no_recipe(self, pk):
+        return Response(
+            {'recipe': [f'Invalid pk "{pk}" - object does not exist.']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def too_large(self, message):
+        return Response(
+            {'non_field_errors': [message]},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    def list_error(self, message):
+        return Response(
+            {'non_field_errors': [message]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
     @action(
         methods=('GET',), detail=False, permission_classes=(IsAuthenticated,)
     )
+    def feed(self, request):
+        '''Recipes of the followed authors, newest first.'''
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            feed_queryset(request.user).select_related('author'),
+            request, view=self
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=('GET',), detail=False)
+    def popular(self, request):
+        '''Recipes by precomputed popularity, most popular first.
+        Recipe filters apply, tags included.'''
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(ranking__isnull=False)
+            .annotate(popularity_rank=F('ranking__rank'))
+        )
+        paginator = PopularPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        methods=('POST',), detail=False, url_path='import',
+        permission_classes=(IsAdmin,)
+    )
+    def import_recipes(self, request):
+        '''Bulk import of recipes sent as NDJSON, one recipe per line.
+        Bodies over IMPORT_MAX_BYTES or IMPORT_MAX_LINES are refused
+        with 413 before anything is imported.'''
+        if int(request.META.get('CONTENT_LENGTH') or 0) > IMPORT_MAX_BYTES:
+            return self.too_large(f'At most {IMPORT_MAX_BYTES} bytes.')
+        with tempfile.TemporaryFile() as body:
+            stream = request.stream
+            for count, line in enumerate(
+                () if stream is None else iter(stream.readline, b''), 1
+            ):
+                if count > IMPORT_MAX_LINES:
+                    return self.too_large(f'At most {IMPORT_MAX_LINES} lines.')
+                body.write(line)
+            body.seek(0)
+            results = list(RecipeImporter(request.user).run(
+                line.decode('utf-8', 'replace') for line in body
+            ))
+        failed = sum('errors' in result for result in results)
+        return Response({
+            'created': len(results) - failed,
+            'failed': failed,
+            'results': results,
+        })
+
+    @action(
+        methods=('GET',), detail=False, permission_classes=(IsAuthenticated,),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, JSONRenderer)
+    )
     def download_shopping_cart(self, request):
-        '''Download shoplist file in txt format'''
-        ingredients = (
-            IngredientInRecipe.objects.filter(
-                recipe__shoplist_recipe__user=request.user
-            )
-            .select_related('ingredient').all()
-            .prefetch_related('recipe').all()
-            .values('ingredient__name', 'ingredient__measurement_unit')
-            .order_by('ingredient__name')
-            .annotate(total=Sum('amount'))
+        '''Download shoplist file in txt, csv or json format.
+        The file is streamed while the rows are read.'''
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            export_shopping_list(request.user, renderer.format),
+            content_type=f'{renderer.media_type}; charset=utf-8'
         )
-        col1 = max(len(ingredient["ingredient__name"])
-                   for ingredient in ingredients)
-        col2 = max(len(str(ingredient["total"]))
-                   for ingredient in ingredients)
-        col3 = max(len(ingredient["ingredient__measurement_unit"])
-                   for ingredient in ingredients)
-        devider = (
-            f'\n|{"_"*(col1+2)}|{"_"*(col2+2)}|{"_"*(col3+2)}|\n')
-        output = 'The list of goods for your recipes. \n\n'
-        output += f',{(len(devider)-devider.count("|"))*"_"},\n'
-        output += devider.join(
-            f'| {ingredient["ingredient__name"]} '
-            f'{(col1-len(ingredient["ingredient__name"]))*" "}'
-            f'| {ingredient["total"]}'
-            f'{(col2-len(str(ingredient["total"])))*" "} '
-            f'| {ingredient["ingredient__measurement_unit"]}'
-            f'{(col3-len(ingredient["ingredient__measurement_unit"]))*" "} |'
-            for ingredient in ingredients
+        response['Content-Disposition'] = (
+            f'attachment; filename=shoplist.{renderer.format}'
         )
-        output += devider
-        filename = 'shoplist.txt'
-        response = HttpResponse(output, content_type="text/plain")
-        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
     @action(
@@ -147,17 +256,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, pk=None):
         '''Add/Delete a recipe to/from favourites.'''
-        data = {
-            'user': request.user.id,
-            'recipe': pk,
-        }
-        serializer = CheckFavouriteSerializer(
-            data=data, context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        if request.method == "POST":
-            return self.add_object(Favourites, request.user, pk)
-        return self.delete_object(Favourites, request.user, pk)
+        return self.toggle_list(Favourites, request, pk)
+
+    @action(
+        detail=False, methods=('POST', 'DELETE'), url_path='favorite',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_batch(self, request):
+        '''Add/Delete many recipes to/from favourites.'''
+        return self.change_list(Favourites, request)
 
 
 class FollowViewSet(UserViewSet):
@@ -168,7 +275,7 @@ class FollowViewSet(UserViewSet):
     @action(methods=('GET',), detail=False)
     def subscriptions(self, request):
         user = request.user
-        queryset = user.follower.all()
+        queryset = user.follower.select_related('author').order_by('id')
         page = self.paginate_queryset(queryset)
         serializer = FollowSerializer(page,
                                       context={'request': request},
@@ -178,8 +285,10 @@ class FollowViewSet(UserViewSet):
     @action(
         methods=('POST', 'DELETE'),
         detail=True)
+    @transaction.atomic
     def subscribe(self, request, id=None):
-        '''Follow the author.'''
+        '''Follow the author.
+        The follow and the followers_count update commit together.'''
         user = request.user
         author = get_object_or_404(UserCustomized, pk=id)
         data = {
@@ -199,7 +308,8 @@ class FollowViewSet(UserViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientsViewSet(ConditionalGetMixin,
+                         viewsets.ReadOnlyModelViewSet):
     '''Ingredients' viewset. Ingredients Model. '''
 
     queryset = Ingredients.objects.all()
@@ -208,3 +318,46 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ('^name',)
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
+    etag_versions = ('ingredients',)
+    limit_query_param = 'limit'
+    ranked_query_param = 'ranked'
+
+    def get_limit(self):
+        '''Optional positive limit of search results.'''
+        try:
+            limit = int(self.request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return None
+        return limit if limit > 0 else None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        limit = self.get_limit()
+        if self.action == 'list' and limit:
+            return queryset[:limit]
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        '''Name autocomplete from the in-memory index.
+        The database search is used when the index is disabled.
+        The unfiltered list is served pre-rendered and compressed.
+        Searches carry the same ETag as the database list.'''
+        name = request.query_params.get(IngredientsFilter.search_param)
+        if not request.query_params and (
+            request.accepted_renderer.format == 'json'
+        ):
+            return ingredient_catalogue.response(request)
+        if name and getattr(settings, 'INGREDIENT_INDEX', True):
+            return self.conditional(self.search_index, request, name)
+        return super().list(request, *args, **kwargs)
+
+    def search_index(self, request, name):
+        '''?ranked=true switches to typo tolerant, popularity ranked
+        search.'''
+        if request.query_params.get(self.ranked_query_param) in (
+            'true', '1'
+        ):
+            return Response(
+                ingredient_index.ranked_search(name, self.get_limit())
+            )
+        return Response(ingredient_index.search(name, self.get_limit()))
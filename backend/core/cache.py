@@ -0,0 +1,52 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{}'
+
+
+class CacheUnavailable(Exception):
+    '''The cache does not keep change counters.'''
+
+
+def _seed():
+    '''Start value for a missing counter.
+    Never reuses values of a counter lost on cache eviction.'''
+    return int(time.time() * 1000)
+
+
+def get_versions(*names):
+    '''Current change counters for the given namespaces.'''
+    keys = {VERSION_KEY.format(name): name for name in names}
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _seed(), timeout=None)
+            found[key] = cache.get(key)
+            if found[key] is None:
+                # Without counters every ETag would stay the same.
+                raise CacheUnavailable(f'Cannot store {key} in the cache.')
+    return {name: found[key] for key, name in keys.items()}
+
+
+def get_version(name):
+    return get_versions(name)[name]
+
+
+def bump_version(name):
+    '''Increment the change counter of a namespace.'''
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), timeout=None)
+        return cache.incr(key)
+
+
+def bump_on_commit(*names):
+    '''Bump counters once the current transaction is committed.'''
+    def bump():
+        for name in names:
+            bump_version(name)
+    transaction.on_commit(bump)
@@ -0,0 +1,157 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+VISIBILITY_TIMEOUT = getattr(settings, 'JOB_VISIBILITY_TIMEOUT', 300)
+RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 30)
+# Seconds finished jobs are kept; failed ones are kept for inspection.
+RETENTION = {
+    Job.DONE: getattr(settings, 'JOB_RETENTION', 24 * 3600),
+    Job.FAILED: getattr(settings, 'JOB_FAILED_RETENTION', 7 * 24 * 3600),
+}
+
+
+def task(name):
+    '''Register a function as the task called name.
+    Task arguments come from the job payload and must be JSON.'''
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def autodiscover():
+    '''Import the tasks module of every installed app.'''
+    for config in apps.get_app_configs():
+        try:
+            import_module(f'{config.name}.tasks')
+        except ModuleNotFoundError as error:
+            if error.name != f'{config.name}.tasks':
+                raise
+
+
+def get_task(name):
+    if name not in TASKS:
+        autodiscover()
+    return TASKS[name]
+
+
+def enqueue(name, payload=None, priority=0, run_at=None, max_attempts=3):
+    '''Queue a task with a dict of keyword arguments.
+    Inside a transaction the job is only visible to workers once
+    the transaction is committed.'''
+    payload = payload or {}
+    if getattr(settings, 'JOBS_EAGER', False):
+        transaction.on_commit(lambda: get_task(name)(**payload))
+        return None
+    return Job.objects.create(
+        name=name,
+        payload=json.dumps(payload),
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def schedule(name, interval, payload=None, priority=0):
+    '''Queue a periodic task to run in interval seconds,
+    unless a run of it is already waiting.
+    Without a worker (JOBS_EAGER) nothing is repeated.'''
+    if getattr(settings, 'JOBS_EAGER', False):
+        return None
+    now = timezone.now()
+    waiting = Job.objects.filter(
+        name=name, status=Job.QUEUED, attempts__lt=F('max_attempts')
+    ).filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+    if waiting.exists():
+        return None
+    return enqueue(
+        name, payload, priority, run_at=now + timedelta(seconds=interval)
+    )
+
+
+def claim(limit, visibility=VISIBILITY_TIMEOUT):
+    '''Lock up to limit due jobs for this worker, highest priority first.
+
+    Claimed jobs stay hidden from other workers for visibility seconds;
+    a job whose worker died becomes due again after that, or fails
+    if that was its last attempt.'''
+    now = timezone.now()
+    with transaction.atomic():
+        Job.objects.filter(
+            status=Job.QUEUED,
+            attempts__gte=F('max_attempts'),
+            locked_until__lt=now,
+        ).update(
+            status=Job.FAILED,
+            run_at=now,
+            locked_until=None,
+            last_error='Worker lost during the last attempt.',
+        )
+        ids = list(
+            Job.objects.select_for_update(
+                skip_locked=connection.features
+                .has_select_for_update_skip_locked
+            )
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .filter(attempts__lt=F('max_attempts'))
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+            .order_by('-priority', 'run_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        Job.objects.filter(id__in=ids).update(
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=visibility),
+        )
+    return ids
+
+
+def run_job(job_id):
+    '''Run a claimed job and record its outcome.
+    Failed jobs are retried with exponential backoff.'''
+    job = Job.objects.get(id=job_id)
+    try:
+        get_task(job.name)(**json.loads(job.payload))
+    except Exception:
+        logger.exception('Job %s failed', job)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+        else:
+            job.run_at = timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** (job.attempts - 1)
+            )
+    else:
+        job.status = Job.DONE
+        job.last_error = ''
+    job.locked_until = None
+    job.save(update_fields=(
+        'status', 'run_at', 'locked_until', 'last_error'
+    ))
+    return job.status
+
+
+def purge():
+    '''Delete jobs finished longer ago than their RETENTION.
+    run_at of a finished job is the time of its last attempt.'''
+    now = timezone.now()
+    query = Q()
+    for status, retention in RETENTION.items():
+        query |= Q(
+            status=status, run_at__lt=now - timedelta(seconds=retention)
+        )
+    deleted, _ = Job.objects.filter(query).delete()
+    return deleted
@@ -0,0 +1,78 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from core.jobs import VISIBILITY_TIMEOUT, claim, purge, run_job, schedule
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs in a pool of processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait when no job is due.'
+        )
+        parser.add_argument(
+            '--visibility-timeout', type=int, default=VISIBILITY_TIMEOUT,
+            help='Seconds before a claimed job may be claimed again.'
+        )
+        parser.add_argument(
+            '--purge-interval', type=float, default=3600,
+            help='Seconds between deletions of old finished jobs, 0 never.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once no job is due.'
+        )
+
+    def handle(self, *args, **options):
+        # Periodic tasks queue their next run; start the chains once.
+        for name in getattr(settings, 'PERIODIC_JOBS', ()):
+            schedule(name, 0)
+        # Spawned, not forked: workers open their own connections.
+        with ProcessPoolExecutor(
+            options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as pool:
+            self.work(pool, options)
+
+    def work(self, pool, options):
+        running = set()
+        purged = None
+        while True:
+            purged = self.purge(purged, options['purge_interval'])
+            free = options['workers'] - len(running)
+            ids = claim(free, options['visibility_timeout']) if free else []
+            running.update(pool.submit(run_job, job_id) for job_id in ids)
+            if running:
+                done, running = wait(
+                    running, options['poll_interval'], FIRST_COMPLETED
+                )
+                for future in done:
+                    self.report(future)
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['poll_interval'])
+
+    def purge(self, purged, interval):
+        '''Delete old finished jobs every interval seconds.
+        Returns the time of the last purge.'''
+        if interval and (
+            purged is None or time.monotonic() - purged >= interval
+        ):
+            self.stdout.write(f'{purge()} finished jobs deleted.')
+            return time.monotonic()
+        return purged
+
+    def report(self, future):
+        try:
+            self.stdout.write(f'Job {future.result()}.')
+        except Exception as error:
+            self.stderr.write(f'Worker error: {error!r}')
@@ -1,7 +1,145 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .cache import get_versions
+
+COUNT_CACHE_TIMEOUT = getattr(settings, 'COUNT_CACHE_TIMEOUT', 300)
+COUNT_ESTIMATE_THRESHOLD = getattr(
+    settings, 'COUNT_ESTIMATE_THRESHOLD', 100000
+)
+
+
+def estimate_count(queryset):
+    '''Planner's row estimate for an unfiltered postgres table.'''
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+            (queryset.model._meta.db_table,),
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class CachedCountPaginator(Paginator):
+    '''Paginator keeping object counts in the cache.
+    Very large unfiltered tables are counted by the planner estimate.'''
+
+    def __init__(self, *args, count_key=None, **kwargs):
+        self.count_key = count_key
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return super().count
+        count = cache.get(self.count_key)
+        if count is None:
+            count = estimate_count(self.object_list)
+            if count is None or count < COUNT_ESTIMATE_THRESHOLD:
+                count = super().count
+            cache.set(self.count_key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class KeysetPagination(CursorPagination):
+    '''Cursor pagination keyed on the primary key.'''
+
+    page_size = 6
+    page_size_query_param = 'page_size'
+    max_page_size = 10
+    ordering = 'id'
+
+
+class FeedPagination(KeysetPagination):
+    '''Newest first cursor pagination of the recipe feed.'''
+
+    ordering = '-id'
+
+
+class PopularPagination(KeysetPagination):
+    '''Cursor pagination of recipes by precomputed popularity rank.'''
+
+    ordering = 'popularity_rank'
 
 
 class StandardResultsSetPagination(PageNumberPagination):
+    '''Page number pagination with an opt-in keyset mode.
+    Keyset mode is enabled by ?pagination=cursor and is kept
+    by the cursor links it returns.
+
+    Views may set count_versions (change counters of the data they list)
+    to cache counts per filter signature, and count_user_versions
+    ({query param: per-user counter}) for user dependent filters.'''
+
     page_size = 6
     page_size_query_param = 'page_size'
     max_page_size = 10
+    mode_query_param = 'pagination'
+    cursor_paginator_class = KeysetPagination
+    cursor_paginator = None
+    count_ignored_params = (
+        'page', 'page_size', 'pagination', 'cursor', 'format'
+    )
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_paginator_class.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.django_paginator_class = partial(
+            CachedCountPaginator, count_key=self.get_count_key(request, view)
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_key(self, request, view):
+        '''Cache key of the count for a normalized filter signature.'''
+        versions = getattr(view, 'count_versions', None)
+        if not versions:
+            return None
+        params = sorted(
+            (key, sorted(set(filter(None, values))))
+            for key, values in request.query_params.lists()
+            if key not in self.count_ignored_params and any(values)
+        )
+        user_versions = getattr(view, 'count_user_versions', {})
+        user_id = None
+        for key, _ in params:
+            if key in user_versions:
+                user_id = request.user.pk
+                versions += (f'{user_versions[key]}:{user_id}',)
+        signature = repr((
+            type(view).__name__,
+            getattr(view, 'action', None),
+            params,
+            user_id,
+            sorted(get_versions(*versions).items()),
+        ))
+        return 'count:' + hashlib.md5(signature.encode()).hexdigest()
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_html_context()
+        return super().get_html_context()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -104,6 +105,62 @@ DATABASES = {
 }
 
 
+# Cache
+# Change counters and recipe cards need memcached: shared by gunicorn
+# workers, the job worker and management commands, atomic incr and
+# multi-get in one round trip. Any other backend is refused unless
+# CACHE_UNSHARED_OK=True, for single-process development only.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.memcached.MemcachedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='127.0.0.1:11211'),
+    }
+}
+if 'memcached' not in CACHES['default']['BACKEND']:
+    if os.getenv('CACHE_UNSHARED_OK', default='') != 'True':
+        raise ImproperlyConfigured(
+            'CACHE_BACKEND must be memcached; set CACHE_UNSHARED_OK=True '
+            'to run with another cache in a single process.'
+        )
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+COUNT_CACHE_TIMEOUT = 300
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+# Ingredient name autocomplete from the in-memory index
+INGREDIENT_INDEX = True
+
+# Background jobs, run by manage.py run_jobs.
+# With JOBS_EAGER tasks run in the request process after commit.
+JOBS_EAGER = os.getenv('JOBS_EAGER', default='') == 'True'
+JOB_VISIBILITY_TIMEOUT = 300
+JOB_RETRY_DELAY = 30
+# Limits of one POST /api/recipes/import/ body.
+IMPORT_MAX_BYTES = 50 * 1024 * 1024
+IMPORT_MAX_LINES = 10000
+
+# Periodic tasks, queued by run_jobs on start unless already waiting.
+PERIODIC_JOBS = ('recipes.rank_recipes',)
+# Finished jobs are deleted by the worker after these seconds.
+JOB_RETENTION = 24 * 3600
+JOB_FAILED_RETENTION = 7 * 24 * 3600
+
+# Recipes of authors with more followers are read into the feed
+# instead of being pushed to every follower's timeline.
+FEED_FANOUT_LIMIT = 1000
+
+# Popular recipes: ranking recomputed every POPULAR_RANKING_INTERVAL
+# seconds from favourites and carts of the last POPULAR_WINDOW days,
+# an event's weight halves every POPULAR_HALF_LIFE days.
+POPULAR_RANKING_INTERVAL = 600
+POPULAR_WINDOW = 90
+POPULAR_HALF_LIFE = 7
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -1,9 +1,28 @@
 from django.contrib import admin
 from .models import Tag, Recipe, Ingredients, IngredientInRecipe, Favourites
+from .shopping import tracking_recipe_totals
 
 
 admin.site.register(Ingredients)
-admin.site.register(IngredientInRecipe)
+
+
+@admin.register(IngredientInRecipe)
+class IngredientInRecipeAdmin(admin.ModelAdmin):
+    '''Ingredients in recipes. Changes reach the shopping lists.'''
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id, form.initial.get('recipe')} - {None}
+        with tracking_recipe_totals(*recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with tracking_recipe_totals(obj.recipe_id):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        with tracking_recipe_totals(*recipe_ids):
+            super().delete_queryset(request, queryset)
 
 
 @admin.register(Tag)
@@ -31,6 +50,11 @@ class RecipesAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     inlines = [IngredientInLine]
 
+    def save_related(self, request, form, formsets, change):
+        '''Changed ingredients reach the shopping lists.'''
+        with tracking_recipe_totals(form.instance.id):
+            super().save_related(request, form, formsets, change)
+
 
 @admin.register(Favourites)
 class FavouritesAdmin(admin.ModelAdmin):
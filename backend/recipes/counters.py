@@ -0,0 +1,49 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from users.models import UserCustomized
+
+from .models import Favourites, Recipe, ShopList
+
+# Counter field: (model, relation it counts).
+COUNTERS = {
+    'recipes_count': (UserCustomized, 'recipes'),
+    'followers_count': (UserCustomized, 'followed'),
+    'favorites_count': (Recipe, 'fav_recipe'),
+    'in_carts_count': (Recipe, 'shoplist_recipe'),
+}
+
+# Recipe counter of each user recipe list.
+LIST_COUNTERS = {
+    Favourites: 'favorites_count',
+    ShopList: 'in_carts_count',
+}
+
+
+def change_counter(field, ids, delta):
+    '''Atomic F() update of a counter of the given rows.'''
+    model = COUNTERS[field][0]
+    model.objects.filter(id__in=ids).update(**{field: F(field) + delta})
+
+
+def actual_count(field):
+    '''Subquery counting the related rows a counter stands for.'''
+    model, relation = COUNTERS[field]
+    foreign_key = model._meta.get_field(relation).field
+    return Coalesce(Subquery(
+        foreign_key.model.objects
+        .filter(**{foreign_key.name: OuterRef('pk')}).order_by()
+        .values(foreign_key.name).annotate(total=Count('id'))
+        .values('total')
+    ), 0)
+
+
+def reconcile_counter(field, start, stop):
+    '''Recount a counter for rows with ids in [start, stop).
+    Returns the number of corrected rows. Runs in a transaction:
+    the rows are locked before the recount, so concurrent F()
+    increments wait for it instead of being overwritten.'''
+    model = COUNTERS[field][0]
+    rows = model.objects.filter(id__gte=start, id__lt=stop)
+    list(rows.select_for_update().values_list('id', flat=True))
+    actual = actual_count(field)
+    return rows.exclude(**{field: actual}).update(**{field: actual})
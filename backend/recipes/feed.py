@@ -0,0 +1,113 @@
+from core.jobs import enqueue
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from users.models import Follow, UserCustomized
+
+from .models import FeedEntry, Recipe
+
+FEED_FANOUT_LIMIT = getattr(settings, 'FEED_FANOUT_LIMIT', 1000)
+POPULAR_KEY = 'feed-popular-authors'
+POPULAR_TIMEOUT = getattr(settings, 'FEED_POPULAR_TIMEOUT', 300)
+
+
+def popular_authors():
+    '''Authors with more than FEED_FANOUT_LIMIT followers.
+    Their recipes are not pushed to timelines but read on demand.'''
+    authors = cache.get(POPULAR_KEY)
+    if authors is None:
+        authors = frozenset(
+            UserCustomized.objects.filter(
+                followers_count__gt=FEED_FANOUT_LIMIT
+            ).values_list('id', flat=True)
+        )
+        cache.set(POPULAR_KEY, authors, POPULAR_TIMEOUT)
+    return authors
+
+
+def fan_out(recipe_ids):
+    '''Push new recipes to the timelines of their authors' followers.'''
+    popular = popular_authors()
+    recipes = Recipe.objects.filter(
+        id__in=recipe_ids, author__isnull=False
+    ).exclude(author_id__in=popular).values_list('id', 'author_id')
+    for recipe_id, author_id in recipes:
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id, author_id=author_id
+                )
+                for user_id in Follow.objects.filter(author_id=author_id)
+                .values_list('user_id', flat=True)
+            ),
+            ignore_conflicts=True,
+        )
+
+
+def followers_changed(author_id, delta):
+    '''Called after the author's followers_count moved by delta.
+    Crossing FEED_FANOUT_LIMIT refreshes the popular authors; an
+    author falling under it gets the recipes the timelines missed.'''
+    count = UserCustomized.objects.filter(id=author_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if count != FEED_FANOUT_LIMIT + (delta > 0):
+        return
+    transaction.on_commit(lambda: cache.delete(POPULAR_KEY))
+    if delta < 0:
+        enqueue('recipes.backfill_author', {'author_id': author_id})
+
+
+def backfill(user_id, author_id):
+    '''Put the recipes of a newly followed author into the timeline.'''
+    if author_id in popular_authors() or not Follow.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).exists():
+        return
+    push_recipes((user_id,), author_id)
+
+
+def backfill_author(author_id):
+    '''Put the recipes of a no longer popular author into the
+    timelines of all followers.'''
+    if author_id in popular_authors():
+        return
+    push_recipes(
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True),
+        author_id,
+    )
+
+
+def push_recipes(user_ids, author_id):
+    '''Timeline entries of all the author's recipes for the users.'''
+    recipe_ids = list(
+        Recipe.objects.filter(author_id=author_id)
+        .values_list('id', flat=True)
+    )
+    for user_id in user_ids:
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id, author_id=author_id
+                )
+                for recipe_id in recipe_ids
+            ),
+            ignore_conflicts=True,
+        )
+
+
+def feed_queryset(user):
+    '''Recipes of the authors the user follows: the timeline
+    merged with recipes of followed popular authors.'''
+    condition = Q(id__in=FeedEntry.objects.filter(user=user).values(
+        'recipe_id'
+    ))
+    fan_in = set(
+        user.follower.filter(author_id__in=popular_authors())
+        .values_list('author_id', flat=True)
+    )
+    if fan_in:
+        condition |= Q(author_id__in=fan_in)
+    return Recipe.objects.filter(condition)
@@ -0,0 +1,106 @@
+import base64
+import io
+import os
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image, ImageOps
+
+BASE64_MARKER = ';base64,'
+DECODE_CHUNK = 64 * 1024
+# Skipped like b64decode does: line breaks and other non-alphabet chars.
+NOT_BASE64 = re.compile('[^A-Za-z0-9+/=]')
+
+# Derivative name: maximal width and height.
+DERIVATIVE_SIZES = {
+    'card': (480, 480),
+    'detail': (1280, 1280),
+}
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+class DecodedImage(TemporaryUploadedFile):
+    '''Temporary file closed when collected.
+    Storage may have moved the file away by then.'''
+
+    def __del__(self):
+        self.close()
+
+
+def decode_base64_image(data):
+    '''File from a data:image/...;base64 URL.
+    Decoded chunk by chunk into a temporary file on disk; characters
+    past the last full 4-character group go on to the next chunk.
+    ValueError if there is no valid base64 data.'''
+    start = data.index(BASE64_MARKER)
+    ext = data[:start].split('/')[-1]
+    image = DecodedImage('temp.' + ext, f'image/{ext}', 0, None)
+    rest = ''
+    for position in range(start + len(BASE64_MARKER), len(data),
+                          DECODE_CHUNK):
+        chunk = rest + NOT_BASE64.sub(
+            '', data[position:position + DECODE_CHUNK]
+        )
+        end = len(chunk) - len(chunk) % 4
+        image.write(base64.b64decode(chunk[:end]))
+        rest = chunk[end:]
+    image.write(base64.b64decode(rest))
+    image.size = image.tell()
+    image.seek(0)
+    return image
+
+
+def derivative_name(name, size, image_format):
+    '''Storage name of a resized copy of the image.'''
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, 'derivatives', f'{stem}_{size}.{image_format}'
+    )
+
+
+def derivative_names(name):
+    '''{size: {format: storage name}} of all derivatives.'''
+    return {
+        size: {
+            image_format: derivative_name(name, size, image_format)
+            for image_format in DERIVATIVE_FORMATS
+        }
+        for size in DERIVATIVE_SIZES
+    }
+
+
+def make_derivatives(name, storage=default_storage):
+    '''Resized WebP and JPEG copies of a stored image.
+    Existing copies are kept.'''
+    names = derivative_names(name)
+    if all(
+        storage.exists(path)
+        for formats in names.values() for path in formats.values()
+    ):
+        return
+    with storage.open(name) as stream:
+        original = ImageOps.exif_transpose(Image.open(stream))
+        original = original.convert('RGB')
+    for size, formats in names.items():
+        image = original.copy()
+        image.thumbnail(DERIVATIVE_SIZES[size], Image.LANCZOS)
+        for image_format, path in formats.items():
+            if storage.exists(path):
+                continue
+            pil_format, options = DERIVATIVE_FORMATS[image_format]
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def delete_derivatives(name, storage=default_storage):
+    '''Remove the resized copies of an image.'''
+    for formats in derivative_names(name).values():
+        for path in formats.values():
+            storage.delete(path)
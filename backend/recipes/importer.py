@@ -0,0 +1,228 @@
+import json
+from itertools import islice
+
+from core.cache import bump_on_commit, get_version
+from core.jobs import enqueue
+from django.core.files import File
+from django.db import DatabaseError, connection, transaction
+from PIL import Image
+
+from .counters import change_counter
+from .images import decode_base64_image
+from .models import IngredientInRecipe, Ingredients, Recipe, Tag
+
+KNOWN_IDS = {}
+
+
+def known_ids(model, version_name):
+    '''Ids of all tags or ingredients, cached per change counter.'''
+    version = get_version(version_name)
+    cached = KNOWN_IDS.get(model)
+    if cached is None or cached[0] != version:
+        cached = (
+            version,
+            frozenset(model.objects.values_list('id', flat=True)),
+        )
+        KNOWN_IDS[model] = cached
+    return cached[1]
+
+
+class RecipeImporter:
+    '''Bulk recipe import from NDJSON lines.
+
+    Items are validated against cached tag and ingredient ids and
+    written in chunks, one transaction and a few bulk inserts per chunk.
+    Every item gets its own result: {'line': n, 'id': id} or
+    {'line': n, 'errors': {...}}.'''
+
+    def __init__(self, author, chunk_size=500):
+        self.author = author
+        self.chunk_size = chunk_size
+        self.tag_ids = known_ids(Tag, 'tags')
+        self.ingredient_ids = known_ids(Ingredients, 'ingredients')
+
+    def run(self, lines):
+        numbered = (
+            (number, line)
+            for number, line in enumerate(lines, 1) if line.strip()
+        )
+        while True:
+            chunk = list(islice(numbered, self.chunk_size))
+            if not chunk:
+                return
+            yield from self.import_chunk(chunk)
+
+    def import_chunk(self, chunk):
+        results, valid = self.validate_chunk(chunk)
+        try:
+            results += self.write_atomic(valid)
+        except DatabaseError:
+            for number, item in valid:
+                try:
+                    results += self.write_atomic([(number, item)])
+                except DatabaseError as error:
+                    results.append(
+                        {'line': number, 'errors': {'database': str(error)}}
+                    )
+        return sorted(results, key=lambda result: result['line'])
+
+    def write_atomic(self, items):
+        '''write() in a transaction. Images stored by a write that is
+        rolled back, at commit too, are deleted from storage.'''
+        images = []
+        try:
+            with transaction.atomic():
+                return self.write(items, images)
+        except DatabaseError:
+            for image in images:
+                image.delete(save=False)
+            raise
+
+    def validate_chunk(self, chunk):
+        '''Error results and valid (line, item) pairs of a chunk.'''
+        results, valid = [], []
+        for number, line in chunk:
+            try:
+                data = json.loads(line)
+            except ValueError as error:
+                results.append(
+                    {'line': number, 'errors': {'json': str(error)}}
+                )
+                continue
+            try:
+                valid.append((number, self.validate(data)))
+            except ValueError as error:
+                results.append({'line': number, 'errors': error.args[0]})
+        return results, valid
+
+    def validate(self, data):
+        '''Cleaned recipe data or ValueError with a dict of errors.'''
+        if not isinstance(data, dict):
+            raise ValueError({'recipe': 'A JSON object is expected.'})
+        errors = self.validate_fields(data)
+        if not self.valid_tags(data.get('tags')):
+            errors['tags'] = 'A list of existing tag ids is expected.'
+        ingredients = self.validate_ingredients(data.get('ingredients'))
+        if isinstance(ingredients, str):
+            errors['ingredients'] = ingredients
+        image = self.validate_image(data.get('image'))
+        if image is False:
+            errors['image'] = 'A base64 encoded image is expected.'
+        if errors:
+            raise ValueError(errors)
+        return {
+            'name': data['name'],
+            'text': data['text'],
+            'cooking_time': int(data['cooking_time']),
+            'tags': set(data['tags']),
+            'ingredients': ingredients,
+            'image': image,
+        }
+
+    def validate_fields(self, data):
+        '''Errors of the plain recipe fields.'''
+        errors = {}
+        for field, limit in (('name', 254), ('text', 500)):
+            if not isinstance(data.get(field), str) or not data[field]:
+                errors[field] = 'This field is required.'
+            elif len(data[field]) > limit:
+                errors[field] = f'At most {limit} characters.'
+        try:
+            if int(data.get('cooking_time')) < 1:
+                errors['cooking_time'] = 'Minimum time is 1 minute'
+        except (TypeError, ValueError):
+            errors['cooking_time'] = 'A number is expected.'
+        return errors
+
+    def valid_tags(self, tags):
+        return isinstance(tags, list) and bool(tags) and all(
+            isinstance(tag, int) and tag in self.tag_ids for tag in tags
+        )
+
+    def validate_image(self, data):
+        '''Decoded image, None without image or False if invalid.'''
+        if not data:
+            return None
+        try:
+            image = decode_base64_image(data)
+            Image.open(image).verify()
+        except Exception:
+            return False
+        image.seek(0)
+        return image
+
+    def validate_ingredients(self, ingredients):
+        '''{ingredient id: amount} or an error message.'''
+        if not isinstance(ingredients, list) or not ingredients:
+            return 'Add at least 1 ingredint.'
+        amounts = {}
+        for item in ingredients:
+            try:
+                ingredient_id, amount = int(item['id']), int(item['amount'])
+            except (KeyError, TypeError, ValueError):
+                return f'Invalid ingredient: {item}.'
+            if ingredient_id not in self.ingredient_ids:
+                return f'No such ingredient: {ingredient_id}.'
+            if ingredient_id in amounts:
+                return f'Ingredient must be unique: {ingredient_id}.'
+            if amount < 1:
+                return 'Minimum quantity is 1 unit'
+            amounts[ingredient_id] = amount
+        return amounts
+
+    def write(self, items, images):
+        '''Insert recipes with their ingredients and tags.
+        Stored image files are appended to images.'''
+        if not items:
+            return []
+        recipes = []
+        for _, item in items:
+            recipe = Recipe(
+                name=item['name'],
+                text=item['text'],
+                cooking_time=item['cooking_time'],
+                author=self.author,
+            )
+            if item['image'] is not None:
+                # A copy: storage would move a temporary file away,
+                # and a retried chunk saves the image again.
+                recipe.image.save(
+                    item['image'].name, File(item['image']), save=False
+                )
+                images.append(recipe.image)
+            recipes.append(recipe)
+        if connection.features.can_return_ids_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            self.recipes_created(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for recipe, (_, item) in zip(recipes, items)
+            for ingredient_id, amount in item['ingredients'].items()
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, (_, item) in zip(recipes, items)
+            for tag_id in item['tags']
+        )
+        bump_on_commit('recipes')
+        return [
+            {'line': number, 'id': recipe.id}
+            for recipe, (number, _) in zip(recipes, items)
+        ]
+
+    def recipes_created(self, recipes):
+        '''What the post_save signals do for recipes saved one by one.'''
+        change_counter('recipes_count', (self.author.id,), len(recipes))
+        enqueue('recipes.fan_out', {
+            'recipe_ids': [recipe.id for recipe in recipes]
+        })
+        for recipe in recipes:
+            if recipe.image:
+                enqueue(
+                    'recipes.make_derivatives', {'name': recipe.image.name}
+                )
@@ -0,0 +1,192 @@
+from core.cache import bump_on_commit
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .counters import LIST_COUNTERS, change_counter
+from .membership import LIST_VERSIONS
+from .models import Recipe, ShopList
+from .shopping import change_cart_totals
+
+# Recipe fields and whether the row was inserted, no row without recipe.
+# {table} is the list table, {recipes} the recipe table.
+ADD_SQL = '''
+WITH recipe AS (
+    SELECT id, name, cooking_time, image, derivatives_ready
+    FROM {recipes} WHERE id = %s
+), added AS (
+    INSERT INTO {table} (user_id, recipe_id, created)
+    SELECT %s, id, %s FROM recipe
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING recipe_id
+)
+SELECT id, name, cooking_time, image, derivatives_ready,
+       EXISTS (SELECT 1 FROM added)
+FROM recipe
+'''
+REMOVE_SQL = '''
+DELETE FROM {table} WHERE user_id = %s AND recipe_id = %s RETURNING id
+'''
+ADD_MANY_SQL = '''
+WITH recipe AS (
+    SELECT id FROM {recipes} WHERE id = ANY(%s)
+), added AS (
+    INSERT INTO {table} (user_id, recipe_id, created)
+    SELECT %s, id, %s FROM recipe
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING recipe_id
+)
+SELECT id, id IN (SELECT recipe_id FROM added) FROM recipe
+'''
+REMOVE_MANY_SQL = '''
+WITH removed AS (
+    DELETE FROM {table} WHERE user_id = %s AND recipe_id = ANY(%s)
+    RETURNING recipe_id
+)
+SELECT id, id IN (SELECT recipe_id FROM removed)
+FROM {recipes} WHERE id = ANY(%s)
+'''
+RECIPE_FIELDS = (
+    'id', 'name', 'cooking_time', 'image', 'derivatives_ready'
+)
+
+# Batch results of every recipe id.
+ADDED, EXISTS, REMOVED, ABSENT, NOT_FOUND = (
+    'added', 'exists', 'removed', 'absent', 'not_found'
+)
+
+
+def add_to_list(model, user, recipe_id):
+    '''Add a recipe to the user's favourites or shopping cart.
+
+    Returns (recipe, added); recipe is None if there is no such recipe.
+    On PostgreSQL this is a single INSERT ... ON CONFLICT DO NOTHING,
+    so concurrent requests never fail on the unique constraint.'''
+    if connection.vendor != 'postgresql':
+        return _orm_add(model, user, recipe_id)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            _sql(ADD_SQL, model),
+            (recipe_id, user.id, timezone.now())
+        )
+        row = cursor.fetchone()
+        if row is not None and row[-1]:
+            list_changed(model, user, (recipe_id,))
+    if row is None:
+        return None, False
+    return Recipe(**dict(zip(RECIPE_FIELDS, row))), row[-1]
+
+
+def _orm_add(model, user, recipe_id):
+    recipe = Recipe.objects.only(*RECIPE_FIELDS).filter(id=recipe_id).first()
+    if recipe is None:
+        return None, False
+    try:
+        with transaction.atomic():
+            model.objects.create(user=user, recipe=recipe)
+    except IntegrityError:
+        return recipe, False
+    return recipe, True
+
+
+def remove_from_list(model, user, recipe_id):
+    '''Remove a recipe from the user's list. True if it was there.'''
+    if connection.vendor != 'postgresql':
+        deleted, _ = model.objects.filter(
+            user=user, recipe_id=recipe_id
+        ).delete()
+        return bool(deleted)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            _sql(REMOVE_SQL, model),
+            (user.id, recipe_id)
+        )
+        removed = cursor.fetchone() is not None
+        if removed:
+            list_changed(model, user, (recipe_id,), -1)
+    return removed
+
+
+def list_changed(model, user, recipe_ids, sign=1):
+    '''What signals do for rows written with raw SQL or in bulk.'''
+    bump_on_commit(f'{LIST_VERSIONS[model]}:{user.id}')
+    change_counter(LIST_COUNTERS[model], recipe_ids, sign)
+    if model is ShopList:
+        change_cart_totals(user.id, recipe_ids, sign)
+
+
+def add_many(model, user, recipe_ids):
+    '''Add recipes to the user's list with one set-based insert.
+    Returns {recipe id: ADDED, EXISTS or NOT_FOUND}.'''
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if connection.vendor == 'postgresql':
+        changed = _execute_many(
+            _sql(ADD_MANY_SQL, model),
+            (recipe_ids, user.id, timezone.now())
+        )
+        added = [pk for pk, inserted in changed.items() if inserted]
+    else:
+        found = set(
+            Recipe.objects.filter(id__in=recipe_ids)
+            .values_list('id', flat=True)
+        )
+        present = set(
+            model.objects.filter(user=user, recipe_id__in=found)
+            .values_list('recipe_id', flat=True)
+        )
+        added = found - present
+        model.objects.bulk_create(
+            (model(user=user, recipe_id=pk) for pk in added),
+            ignore_conflicts=True
+        )
+        changed = {pk: pk not in present for pk in found}
+    if added:
+        list_changed(model, user, added)
+    return _results(recipe_ids, changed, ADDED, EXISTS)
+
+
+def remove_many(model, user, recipe_ids):
+    '''Remove recipes from the user's list with one set-based delete.
+    Returns {recipe id: REMOVED, ABSENT or NOT_FOUND}.'''
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if connection.vendor == 'postgresql':
+        changed = _execute_many(
+            _sql(REMOVE_MANY_SQL, model),
+            (user.id, recipe_ids, recipe_ids)
+        )
+        removed = [pk for pk, deleted in changed.items() if deleted]
+        if removed:
+            list_changed(model, user, removed, -1)
+    else:
+        present = set(
+            model.objects.filter(user=user, recipe_id__in=recipe_ids)
+            .values_list('recipe_id', flat=True)
+        )
+        model.objects.filter(user=user, recipe_id__in=present).delete()
+        changed = {
+            pk: pk in present
+            for pk in Recipe.objects.filter(id__in=recipe_ids)
+            .values_list('id', flat=True)
+        }
+    return _results(recipe_ids, changed, REMOVED, ABSENT)
+
+
+def _sql(template, model):
+    '''Statement for the list model's table and the recipe table.'''
+    return template.format(
+        table=model._meta.db_table, recipes=Recipe._meta.db_table
+    )
+
+
+def _execute_many(sql, params):
+    '''{recipe id: changed} of a batch statement.'''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return dict(cursor.fetchall())
+
+
+def _results(recipe_ids, changed, done, unchanged):
+    return {
+        pk: NOT_FOUND if pk not in changed
+        else done if changed[pk] else unchanged
+        for pk in recipe_ids
+    }
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from recipes.importer import RecipeImporter
+from users.models import UserCustomized
+
+
+class Command(BaseCommand):
+    help = 'Bulk import recipes from an NDJSON file, one recipe per line.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON file, - for stdin.')
+        parser.add_argument(
+            '--author', required=True, help='Username of the author.'
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            author = UserCustomized.objects.get(username=options['author'])
+        except UserCustomized.DoesNotExist:
+            raise CommandError(f'No such user: {options["author"]}')
+        importer = RecipeImporter(author, options['chunk_size'])
+        if options['path'] == '-':
+            self.run(importer, sys.stdin)
+            return
+        with open(options['path'], encoding='utf-8') as stream:
+            self.run(importer, stream)
+
+    def run(self, importer, stream):
+        created = failed = 0
+        for result in importer.run(stream):
+            if 'errors' in result:
+                failed += 1
+                self.stderr.write(f'line {result["line"]}: {result["errors"]}')
+            else:
+                created += 1
+        self.stdout.write(f'{created} recipes created, {failed} failed.')
@@ -0,0 +1,209 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from core.cache import bump_version
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.models import Ingredients, Tag
+
+FIXTURE_MODELS = {'recipes.ingredients': Ingredients, 'recipes.tag': Tag}
+# Fields loaded for each model.
+LOADED_FIELDS = {
+    Ingredients: ('name', 'measurement_unit'),
+    Tag: ('name', 'color', 'slug'),
+}
+
+
+def read_array_start(stream, chunk_size):
+    '''Text following the opening bracket of a JSON array.'''
+    buffer = ''
+    while not buffer.strip():
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise CommandError('Empty JSON file.')
+        buffer += chunk
+    buffer = buffer.lstrip()
+    if buffer[0] != '[':
+        raise CommandError('A JSON array is expected.')
+    return buffer[1:]
+
+
+def iter_json_array(stream, chunk_size=65536):
+    '''Objects of a JSON array read chunk by chunk.'''
+    decoder = json.JSONDecoder()
+    buffer = read_array_start(stream, chunk_size)
+    while True:
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                break
+            yield item
+            buffer = buffer[end:]
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise CommandError('Malformed JSON.')
+        buffer += chunk
+
+
+def iter_records(path):
+    '''(model, fields) pairs of a CSV, JSON array or NDJSON file.'''
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='') as stream:
+        if extension == '.csv':
+            for row in csv.reader(stream):
+                if len(row) < 2 or row[:2] == ['name', 'units']:
+                    continue
+                yield Ingredients, {
+                    'name': row[0], 'measurement_unit': row[1]
+                }
+            return
+        if extension in ('.jsonl', '.ndjson'):
+            items = (json.loads(line) for line in stream if line.strip())
+        else:
+            items = iter_json_array(stream)
+        for item in items:
+            if 'model' in item:
+                yield FIXTURE_MODELS[item['model']], item['fields']
+            elif 'slug' in item:
+                yield Tag, item
+            else:
+                yield Ingredients, item
+
+
+def clean_record(model, fields):
+    '''Stripped values of the loaded fields.
+    ValueError if one is missing, empty or too long for the column.'''
+    cleaned = {}
+    for name in LOADED_FIELDS[model]:
+        value = fields.get(name)
+        value = value.strip() if isinstance(value, str) else ''
+        if not value:
+            raise ValueError(f'{name} is empty')
+        limit = model._meta.get_field(name).max_length
+        if limit and len(value) > limit:
+            raise ValueError(f'{name} is longer than {limit} characters')
+        cleaned[name] = value
+    return cleaned
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk load ingredients and tags from CSV, JSON, fixture '
+        'or NDJSON files. Existing rows are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Do not use postgres COPY.'
+        )
+
+    def handle(self, *args, **options):
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        self.known_ingredients = None
+        for path in options['paths']:
+            if not os.path.exists(path):
+                raise CommandError(f'No such file: {path}')
+            started = time.monotonic()
+            self.read = self.skipped = created = 0
+            for batch in batches(
+                self.clean_records(path), options['batch_size']
+            ):
+                created += self.load_batch(batch)
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'{path}: {self.read} rows read, {created} created, '
+                f'{self.skipped} skipped in {elapsed:.2f}s '
+                f'({self.read / elapsed:.0f} rows/s)'
+            )
+        bump_version('ingredients')
+        bump_version('tags')
+
+    def clean_records(self, path):
+        '''Valid (model, fields) pairs; invalid records are reported.'''
+        for number, (model, fields) in enumerate(iter_records(path), 1):
+            self.read += 1
+            try:
+                yield model, clean_record(model, fields)
+            except ValueError as error:
+                self.skipped += 1
+                self.stderr.write(f'{path}: record {number} skipped: {error}')
+
+    def load_batch(self, batch):
+        ingredients, tags = {}, []
+        for model, fields in batch:
+            if model is Tag:
+                tags.append(Tag(**fields))
+            else:
+                key = (fields['name'], fields['measurement_unit'])
+                ingredients[key] = None
+        created = 0
+        with transaction.atomic():
+            if tags:
+                before = Tag.objects.count()
+                Tag.objects.bulk_create(tags, ignore_conflicts=True)
+                created += Tag.objects.count() - before
+            if ingredients:
+                if self.use_copy:
+                    created += self.copy_ingredients(ingredients)
+                else:
+                    created += self.create_ingredients(ingredients)
+        return created
+
+    def copy_ingredients(self, keys):
+        '''COPY into a temporary table, then insert the missing rows.'''
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(keys)
+        buffer.seek(0)
+        table = Ingredients._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE IF NOT EXISTS ingredients_load '
+                '(name text, measurement_unit text) ON COMMIT DELETE ROWS'
+            )
+            cursor.copy_expert(
+                'COPY ingredients_load FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT l.name, l.measurement_unit '
+                'FROM ingredients_load l WHERE NOT EXISTS ('
+                f'SELECT 1 FROM {table} i WHERE i.name = l.name '
+                'AND i.measurement_unit = l.measurement_unit)'
+            )
+            return cursor.rowcount
+
+    def create_ingredients(self, keys):
+        '''bulk_create of the rows not loaded yet.'''
+        if self.known_ingredients is None:
+            self.known_ingredients = set(
+                Ingredients.objects.values_list('name', 'measurement_unit')
+            )
+        new = [key for key in keys if key not in self.known_ingredients]
+        Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in new
+        )
+        self.known_ingredients.update(new)
+        return len(new)
@@ -0,0 +1,18 @@
+from core.jobs import schedule
+from django.core.management.base import BaseCommand
+from recipes.ranking import rank_recipes
+
+
+class Command(BaseCommand):
+    help = 'Recompute the popular recipes ranking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--schedule', action='store_true',
+            help='Also queue the periodic ranking job, as run_jobs does.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{rank_recipes()} recipes ranked.')
+        if options['schedule']:
+            schedule('recipes.rank_recipes', 0)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from recipes.models import ShopList, ShopListIngredient
+from recipes.shopping import rebuild_totals
+
+
+class Command(BaseCommand):
+    help = 'Recount the shopping list totals of all users from their carts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Users recounted in one transaction.'
+        )
+
+    def handle(self, *args, **options):
+        carts = ShopList.objects.values_list('user_id', flat=True)
+        totals = ShopListIngredient.objects.values_list('user_id', flat=True)
+        user_ids = sorted(carts.order_by().union(totals.order_by()))
+        size = options['batch_size']
+        for start in range(0, len(user_ids), size):
+            rebuild_totals(user_ids[start:start + size])
+        self.stdout.write(f'Shopping lists of {len(user_ids)} users rebuilt.')
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from recipes.counters import COUNTERS, reconcile_counter
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized counters of users and recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Rows recounted in one transaction.'
+        )
+        parser.add_argument(
+            'counters', nargs='*',
+            help=f'Counters to recount: {", ".join(COUNTERS)}. All by default.'
+        )
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        unknown = set(options['counters']) - set(COUNTERS)
+        if unknown:
+            raise CommandError(f'Unknown counters: {", ".join(unknown)}')
+        for field in options['counters'] or COUNTERS:
+            model = COUNTERS[field][0]
+            last = model.objects.aggregate(last=Max('id'))['last'] or 0
+            fixed = 0
+            for start in range(1, last + 1, size):
+                with transaction.atomic():
+                    fixed += reconcile_counter(field, start, start + size)
+            self.stdout.write(f'{field}: {fixed} rows fixed.')
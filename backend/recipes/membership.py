@@ -0,0 +1,33 @@
+from core.cache import get_version
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Favourites, ShopList
+
+MEMBERS_KEY = 'members:{}:{}:{}'
+MEMBERS_TIMEOUT = getattr(settings, 'MEMBERS_CACHE_TIMEOUT', 3600)
+
+# Change counter namespace of each user recipe list.
+LIST_VERSIONS = {
+    Favourites: 'favourites',
+    ShopList: 'shoplist',
+}
+
+
+def get_member_ids(model, user):
+    '''Ids of recipes in the user's favourites or shopping cart.
+    Cached per user and per list version.'''
+    if not user.is_authenticated:
+        return frozenset()
+    namespace = LIST_VERSIONS[model]
+    version = get_version(f'{namespace}:{user.pk}')
+    key = MEMBERS_KEY.format(namespace, user.pk, version)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(
+            model.objects.filter(user=user).values_list(
+                'recipe_id', flat=True
+            )
+        )
+        cache.set(key, ids, MEMBERS_TIMEOUT)
+    return ids
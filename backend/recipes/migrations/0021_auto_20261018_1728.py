@@ -0,0 +1,45 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:28
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Rows older than the created column have no known date: stamped long
+# ago, they stay out of the popularity window.
+LEGACY_CREATED = datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_auto_20261018_1727'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRanking',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ranking', serialize=False, to='recipes.Recipe', verbose_name='Recipe')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveIntegerField(unique=True)),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинг рецептов',
+                'ordering': ('rank',),
+            },
+        ),
+        migrations.AddField(
+            model_name='favourites',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=LEGACY_CREATED),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoplist',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=LEGACY_CREATED),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:43
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from recipes.images import derivative_names
+
+
+def mark_ready(apps, schema_editor):
+    '''Recipes whose image copies were already made.'''
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ready = [
+        recipe_id
+        for recipe_id, name in Recipe.objects.exclude(image='')
+        .values_list('id', 'image').iterator()
+        if all(
+            default_storage.exists(path)
+            for formats in derivative_names(name).values()
+            for path in formats.values()
+        )
+    ]
+    Recipe.objects.filter(id__in=ready).update(derivatives_ready=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_auto_20261018_1728'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='derivatives_ready',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(mark_ready, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from core.models import CountersMixin
 from django.db import models
 from django.core.validators import MinValueValidator, RegexValidator
 from users.models import UserCustomized
@@ -79,7 +80,7 @@ class Ingredients(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     name = models.TextField(max_length=254)
     text = models.CharField(max_length=500)
     cooking_time = models.IntegerField(
@@ -88,6 +89,8 @@ class Recipe(models.Model):
         )
     )
     image = models.ImageField('Image', upload_to='recipes/', blank=True)
+    # Resized copies of the current image are stored.
+    derivatives_ready = models.BooleanField(default=False, editable=False)
     ingredients = models.ManyToManyField(
         Ingredients,
         through='IngredientInRecipe',
@@ -106,6 +109,10 @@ class Recipe(models.Model):
         blank=True,
         null=True
     )
+    favorites_count = models.IntegerField(default=0, editable=False)
+    in_carts_count = models.IntegerField(default=0, editable=False)
+
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ("id",)
@@ -168,6 +175,7 @@ class Favourites(models.Model):
         related_name='fav_recipe',
         verbose_name='Recipe'
     )
+    created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ("-id",)
@@ -193,6 +201,7 @@ class ShopList(models.Model):
         related_name='shoplist_recipe',
         verbose_name='Recipe'
     )
+    created = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ("-id",)
@@ -202,3 +211,85 @@ class ShopList(models.Model):
 
     def __str__(self):
         return self.recipe.name
+
+
+class ShopListIngredient(models.Model):
+    '''Total amount of an ingredient in the user's shopping cart.
+    Kept up to date by recipes.shopping.'''
+    user = models.ForeignKey(
+        UserCustomized,
+        on_delete=models.CASCADE,
+        related_name='shoplist_totals',
+        verbose_name='User'
+    )
+    ingredient = models.ForeignKey(
+        Ingredients,
+        on_delete=models.CASCADE,
+        related_name='shoplist_totals',
+        verbose_name='Ingredient'
+    )
+    total = models.IntegerField(verbose_name='количество')
+
+    class Meta:
+        constraints = (models.UniqueConstraint(fields=("user", "ingredient"),
+                                               name="unique_user_ingredient"),)
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+
+    def __str__(self):
+        return self.ingredient.name
+
+
+class FeedEntry(models.Model):
+    '''Recipe pushed to a follower's feed. Filled by recipes.feed.'''
+    user = models.ForeignKey(
+        UserCustomized,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='User'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Recipe'
+    )
+    author = models.ForeignKey(
+        UserCustomized,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Post author'
+    )
+
+    class Meta:
+        constraints = (models.UniqueConstraint(fields=("user", "recipe"),
+                                               name="unique_user_feed"),)
+        indexes = (
+            models.Index(fields=("user", "author"), name="feed_author_idx"),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента'
+
+    def __str__(self):
+        return self.recipe.name
+
+
+class RecipeRanking(models.Model):
+    '''Precomputed popularity of a recipe, rebuilt by recipes.ranking.'''
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ranking',
+        verbose_name='Recipe'
+    )
+    score = models.FloatField()
+    rank = models.PositiveIntegerField(unique=True)
+
+    class Meta:
+        ordering = ("rank",)
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинг рецептов'
+
+    def __str__(self):
+        return self.recipe.name
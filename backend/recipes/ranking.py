@@ -0,0 +1,61 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Favourites, RecipeRanking, ShopList
+
+HALF_LIFE = getattr(settings, 'POPULAR_HALF_LIFE', 7)
+WINDOW = getattr(settings, 'POPULAR_WINDOW', 90)
+RANKING_SIZE = getattr(settings, 'POPULAR_RANKING_SIZE', 10000)
+# Weight of one event of each user list.
+ACTIVITY_WEIGHTS = {
+    Favourites: 1.0,
+    ShopList: 0.5,
+}
+
+
+def recipe_scores(now=None):
+    '''{recipe id: score}. Every favourite and cart addition counts
+    with its weight, halved every HALF_LIFE days. Events are grouped
+    by day and older than WINDOW days are ignored.'''
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    decay = math.log(2) / HALF_LIFE
+    scores = {}
+    for model, weight in ACTIVITY_WEIGHTS.items():
+        days = (
+            model.objects.filter(created__gte=now - timedelta(days=WINDOW))
+            .annotate(day=TruncDate('created'))
+            .values('recipe_id', 'day')
+            .annotate(events=Count('id'))
+            .values_list('recipe_id', 'day', 'events')
+            .order_by()
+        )
+        for recipe_id, day, events in days:
+            age = (today - day).days
+            scores[recipe_id] = (
+                scores.get(recipe_id, 0)
+                + weight * events * math.exp(-decay * age)
+            )
+    return scores
+
+
+def rank_recipes(now=None):
+    '''Replace the ranking with the RANKING_SIZE best scored recipes.
+    Returns the number of ranked recipes.'''
+    top = sorted(
+        recipe_scores(now).items(),
+        key=lambda item: (-item[1], -item[0])
+    )[:RANKING_SIZE]
+    with transaction.atomic():
+        RecipeRanking.objects.all().delete()
+        RecipeRanking.objects.bulk_create(
+            RecipeRanking(recipe_id=recipe_id, score=score, rank=rank)
+            for rank, (recipe_id, score) in enumerate(top, 1)
+        )
+    return len(top)
@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from .models import IngredientInRecipe, ShopList, ShopListIngredient
+
+TOTALS_TABLE = ShopListIngredient._meta.db_table
+# Add (sign 1) or subtract (sign -1) recipes' ingredients for a user.
+CART_SQL = f'''
+INSERT INTO {TOTALS_TABLE} (user_id, ingredient_id, total)
+SELECT %s, ingredient_id, SUM(amount) * %s
+FROM {IngredientInRecipe._meta.db_table}
+WHERE recipe_id = ANY(%s)
+GROUP BY ingredient_id
+ON CONFLICT (user_id, ingredient_id)
+DO UPDATE SET total = {TOTALS_TABLE}.total + EXCLUDED.total
+'''
+DELTAS_SQL = f'''
+INSERT INTO {TOTALS_TABLE} (user_id, ingredient_id, total)
+SELECT * FROM unnest(%s::integer[], %s::integer[], %s::integer[])
+ON CONFLICT (user_id, ingredient_id)
+DO UPDATE SET total = {TOTALS_TABLE}.total + EXCLUDED.total
+'''
+
+
+def change_cart_totals(user_id, recipe_ids, sign=1):
+    '''Add the ingredients of recipes put into the user's cart,
+    or subtract them with sign=-1.'''
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(CART_SQL, (user_id, sign, recipe_ids))
+        if sign < 0:
+            drop_empty((user_id,))
+        return
+    amounts = (
+        IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+        .values_list('ingredient_id').annotate(Sum('amount')).order_by()
+    )
+    apply_deltas({
+        (user_id, ingredient_id): amount * sign
+        for ingredient_id, amount in amounts
+    })
+
+
+def shift_recipe_totals(recipe_id, changes):
+    '''Apply {ingredient id: amount change} of a recipe to the totals
+    of every user who has the recipe in the cart.'''
+    changes = {
+        ingredient_id: delta
+        for ingredient_id, delta in changes.items() if delta
+    }
+    if not changes:
+        return
+    apply_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in ShopList.objects.filter(recipe_id=recipe_id)
+        .values_list('user_id', flat=True)
+        for ingredient_id, delta in changes.items()
+    })
+
+
+@contextmanager
+def tracking_recipe_totals(*recipe_ids):
+    '''Shift the totals by the ingredient changes made in the block
+    to the given recipes.'''
+    def amounts():
+        return {
+            (recipe_id, ingredient_id): amount
+            for recipe_id, ingredient_id, amount
+            in IngredientInRecipe.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('recipe_id', 'ingredient_id', 'amount')
+        }
+    before = amounts()
+    yield
+    after = amounts()
+    changes = {}
+    for key in before.keys() | after.keys():
+        changes.setdefault(key[0], {})[key[1]] = (
+            after.get(key, 0) - before.get(key, 0)
+        )
+    for recipe_id, recipe_changes in changes.items():
+        shift_recipe_totals(recipe_id, recipe_changes)
+
+
+def apply_deltas(deltas):
+    '''Add {(user id, ingredient id): delta} to the totals.
+    Totals that drop to zero are deleted.'''
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    user_ids = {user_id for user_id, _ in deltas}
+    shrinking = any(delta < 0 for delta in deltas.values())
+    if connection.vendor == 'postgresql':
+        keys = list(deltas)
+        with connection.cursor() as cursor:
+            cursor.execute(DELTAS_SQL, (
+                [user_id for user_id, _ in keys],
+                [ingredient_id for _, ingredient_id in keys],
+                [deltas[key] for key in keys],
+            ))
+    else:
+        _orm_apply_deltas(deltas, user_ids)
+    if shrinking:
+        drop_empty(user_ids)
+
+
+def _orm_apply_deltas(deltas, user_ids):
+    deltas = dict(deltas)
+    existing = ShopListIngredient.objects.select_for_update().filter(
+        user_id__in=user_ids,
+        ingredient_id__in={ingredient_id for _, ingredient_id in deltas},
+    )
+    changed = []
+    for row in existing:
+        delta = deltas.pop((row.user_id, row.ingredient_id), None)
+        if delta is not None:
+            row.total += delta
+            changed.append(row)
+    ShopListIngredient.objects.bulk_update(changed, ('total',))
+    ShopListIngredient.objects.bulk_create(
+        ShopListIngredient(
+            user_id=user_id, ingredient_id=ingredient_id, total=delta
+        )
+        for (user_id, ingredient_id), delta in deltas.items()
+    )
+
+
+def drop_empty(user_ids):
+    ShopListIngredient.objects.filter(
+        user_id__in=user_ids, total__lte=0
+    ).delete()
+
+
+def rebuild_totals(user_ids):
+    '''Recount the totals of the given users from their carts.'''
+    user_ids = list(user_ids)
+    with transaction.atomic():
+        ShopListIngredient.objects.filter(user_id__in=user_ids).delete()
+        ShopListIngredient.objects.bulk_create(
+            ShopListIngredient(
+                user_id=row['recipe__shoplist_recipe__user_id'],
+                ingredient_id=row['ingredient_id'],
+                total=row['total'],
+            )
+            for row in IngredientInRecipe.objects.filter(
+                recipe__shoplist_recipe__user_id__in=user_ids
+            )
+            .values('recipe__shoplist_recipe__user_id', 'ingredient_id')
+            .annotate(total=Sum('amount')).order_by()
+        )
@@ -0,0 +1,205 @@
+from core.cache import bump_on_commit
+from core.jobs import enqueue
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from users.models import Follow, UserCustomized
+
+from .counters import LIST_COUNTERS, change_counter
+from .feed import followers_changed
+from .membership import LIST_VERSIONS
+from .models import (
+    Favourites, FeedEntry, IngredientInRecipe, Ingredients, Recipe, ShopList,
+    Tag
+)
+from .shopping import change_cart_totals
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    bump_on_commit('recipes', f'recipe:{instance.id}')
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    '''Push a new recipe to the followers' feeds.'''
+    if created:
+        enqueue('recipes.fan_out', {'recipe_ids': [instance.id]})
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_image_saving(sender, instance, **kwargs):
+    '''A new image has no resized copies yet; an unchanged one keeps
+    the stored derivatives_ready, a stale instance may not have it.'''
+    stored = None
+    if instance.pk is not None:
+        stored = sender.objects.filter(pk=instance.pk).values(
+            'image', 'derivatives_ready'
+        ).first()
+    instance._image_changed = (
+        stored is None or stored['image'] != instance.image.name
+    )
+    instance._replaced_image = None
+    if instance._image_changed:
+        instance.derivatives_ready = False
+        if stored is not None:
+            instance._replaced_image = stored['image']
+    else:
+        instance.derivatives_ready = stored['derivatives_ready']
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    '''Resized copies of a new recipe image, made by a worker;
+    those of the replaced image are removed.'''
+    if instance.image and getattr(instance, '_image_changed', True):
+        enqueue(
+            'recipes.make_derivatives', {'name': instance.image.name}
+        )
+    replaced = getattr(instance, '_replaced_image', None)
+    if replaced:
+        enqueue('recipes.delete_derivatives', {'name': replaced})
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(sender, instance, **kwargs):
+    if instance.image:
+        enqueue(
+            'recipes.delete_derivatives', {'name': instance.image.name}
+        )
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_on_commit('recipes', f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action == 'pre_clear':
+            recipe_ids = list(instance.recipes.values_list('id', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            recipe_ids = pk_set
+        else:
+            return
+    elif action.startswith('post_'):
+        recipe_ids = (instance.id,)
+    else:
+        return
+    bump_on_commit('recipes', *(f'recipe:{pk}' for pk in recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_on_commit('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def ingredient_changed(sender, **kwargs):
+    bump_on_commit('ingredients')
+
+
+# Author's fields shown in the recipe cards.
+CARD_USER_FIELDS = frozenset(('email', 'username', 'first_name', 'last_name'))
+
+
+@receiver(pre_save, sender=UserCustomized)
+def user_saving(sender, instance, update_fields, **kwargs):
+    '''Note whether the save changes the author's data in the cards.
+    Saves of other fields, like last_login on every login, do not.'''
+    if instance.pk is None:
+        instance._card_changed = True
+    elif update_fields is not None and CARD_USER_FIELDS.isdisjoint(
+        update_fields
+    ):
+        instance._card_changed = False
+    else:
+        stored = sender.objects.filter(pk=instance.pk).values(
+            *CARD_USER_FIELDS
+        ).first()
+        instance._card_changed = stored != {
+            field: getattr(instance, field) for field in CARD_USER_FIELDS
+        }
+
+
+@receiver(post_save, sender=UserCustomized)
+def user_changed(sender, instance, **kwargs):
+    '''Author's data in the recipe cards changed.'''
+    if getattr(instance, '_card_changed', True):
+        bump_on_commit('users', f'user:{instance.id}')
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_changed(sender, instance, **kwargs):
+    bump_on_commit(f'follows:{instance.user_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        enqueue('recipes.backfill_feed', {
+            'user_id': instance.user_id, 'author_id': instance.author_id
+        })
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    '''Unfollowed author's recipes leave the feed.'''
+    FeedEntry.objects.filter(
+        user_id=instance.user_id, author_id=instance.author_id
+    ).delete()
+
+
+@receiver((post_save, post_delete), sender=Favourites)
+@receiver((post_save, post_delete), sender=ShopList)
+def user_list_changed(sender, instance, **kwargs):
+    '''Favourites or shopping cart changed.
+    Moves the user's membership cache to a new version.'''
+    bump_on_commit(f'{LIST_VERSIONS[sender]}:{instance.user_id}')
+
+
+@receiver(post_save, sender=ShopList)
+def cart_added(sender, instance, created, **kwargs):
+    if created:
+        change_cart_totals(instance.user_id, (instance.recipe_id,))
+
+
+@receiver(pre_delete, sender=ShopList)
+def cart_removed(sender, instance, **kwargs):
+    '''Before deletion: a deleted recipe still has its ingredients.'''
+    change_cart_totals(instance.user_id, (instance.recipe_id,), -1)
+
+
+def counter_delta(kwargs):
+    '''1 for a created row, -1 for a deleted one, 0 for an update.'''
+    if 'created' not in kwargs:
+        return -1
+    return 1 if kwargs['created'] else 0
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_counted(sender, instance, **kwargs):
+    '''Author's recipes_count.'''
+    delta = counter_delta(kwargs)
+    if delta and instance.author_id is not None:
+        change_counter('recipes_count', (instance.author_id,), delta)
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_counted(sender, instance, **kwargs):
+    '''Author's followers_count.'''
+    delta = counter_delta(kwargs)
+    if delta:
+        change_counter('followers_count', (instance.author_id,), delta)
+        followers_changed(instance.author_id, delta)
+
+
+@receiver((post_save, post_delete), sender=Favourites)
+@receiver((post_save, post_delete), sender=ShopList)
+def user_list_counted(sender, instance, **kwargs):
+    '''Recipe's favorites_count or in_carts_count.'''
+    delta = counter_delta(kwargs)
+    if delta:
+        change_counter(LIST_COUNTERS[sender], (instance.recipe_id,), delta)
@@ -0,0 +1,52 @@
+from core.cache import bump_on_commit
+from core.jobs import schedule, task
+from django.conf import settings
+
+from .feed import backfill, backfill_author, fan_out
+from .images import delete_derivatives, make_derivatives
+from .models import Recipe
+from .ranking import rank_recipes
+
+RANKING_INTERVAL = getattr(settings, 'POPULAR_RANKING_INTERVAL', 600)
+
+
+@task('recipes.make_derivatives')
+def make_image_derivatives(name):
+    '''Resize the image, then let the recipes using it show the copies.'''
+    make_derivatives(name)
+    recipe_ids = list(
+        Recipe.objects.filter(image=name).values_list('id', flat=True)
+    )
+    Recipe.objects.filter(id__in=recipe_ids).update(derivatives_ready=True)
+    bump_on_commit('recipes', *(f'recipe:{pk}' for pk in recipe_ids))
+
+
+@task('recipes.delete_derivatives')
+def delete_image_derivatives(name):
+    '''Remove resized copies of an image no recipe uses any more.'''
+    if not Recipe.objects.filter(image=name).exists():
+        delete_derivatives(name)
+
+
+@task('recipes.fan_out')
+def fan_out_recipes(recipe_ids):
+    fan_out(recipe_ids)
+
+
+@task('recipes.backfill_feed')
+def backfill_feed(user_id, author_id):
+    backfill(user_id, author_id)
+
+
+@task('recipes.backfill_author')
+def backfill_author_feeds(author_id):
+    backfill_author(author_id)
+
+
+@task('recipes.rank_recipes')
+def rank_recipes_periodically():
+    '''Recompute the popularity ranking and queue the next run.
+    The next run is queued first, so retries of a failed run
+    do not start a second chain.'''
+    schedule('recipes.rank_recipes', RANKING_INTERVAL)
+    rank_recipes()
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.19 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20230429_0810'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercustomized',
+            name='followers_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='usercustomized',
+            name='recipes_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
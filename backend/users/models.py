@@ -1,10 +1,11 @@
+from core.models import CountersMixin
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.db.models import Q, F
 from .validators import validate_username
 
 
-class UserCustomized(AbstractUser):
+class UserCustomized(CountersMixin, AbstractUser):
     USER = 'user'
     ADMIN = 'admin'
     ROLE_CHOICES = (
@@ -22,6 +23,10 @@ class UserCustomized(AbstractUser):
     role = models.CharField(max_length=10,
                             choices=ROLE_CHOICES,
                             default='user')
+    recipes_count = models.IntegerField(default=0, editable=False)
+    followers_count = models.IntegerField(default=0, editable=False)
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     @property
     def is_admin(self):